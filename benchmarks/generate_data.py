@@ -0,0 +1,203 @@
+import os, sys
+import argparse
+import pathlib
+import shutil
+
+import pandas as pd, numpy as np
+from datetime import datetime, time, timedelta
+from openpyxl import Workbook
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+sys.path.append(f"{PROJECT_DIR}/src")
+from game_log import PLAY_SHEETS
+
+# number of rows in the stats sheet of each benchmark workbook - 4 rows per game
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+PLAYERS = ["Hagen", "Jake", "Brandon", "Bruno", "Carlos", "Cody", "Devin", "German", "Jason", "Josh",
+           "Nate", "Robbie", "Tommy", "True", "Tyler", "Chase", "Mason", "Logan", "Ryan", "Evan"]
+N_SESSIONS = 60 # sessions are spread over the season so bigger workbooks have longer sessions
+STATS_COLUMNS = ['date', 'name', 'partner', 'win_loss', 'points_for', 'points_against', 'match_id', 'tournament',
+                 'serves', 'aces', 'missed_serves', 'received', 'swings', 'swing_kills', 'blocks', 'block_kills',
+                 'bump_kills', 'hitting_errors', 'errors', 'serving_percentage', 'kills', 'hitting_efficiency',
+                 'blocking_efficiency', 'serve_receive_rating', 'effectiveness', 'positive', 'pass_rating'] + [f"switch{i+1}" for i in range(8)]
+
+def make_stats(n_rows, seed=0, start=datetime(2022, 2, 1)):
+    """
+    Makes a synthetic "stats" sheet
+
+    Parameters
+    ----------
+    n_rows : int
+        number of rows - rounded down to a whole number of games
+    seed : int, default 0
+        seed for the random number generator
+    start : datetime, default 2022-02-01
+        date of the first session
+
+    Returns
+    -------
+    <stats> : DataFrame
+        one row per player per game with the columns of the real workbook
+    """
+    rng = np.random.default_rng(seed)
+    n_games = max(n_rows // 4, 1)
+    n = n_games * 4
+
+    # games - players 0/1 beat players 2/3
+    session = np.arange(n_games) * N_SESSIONS // n_games
+    dates = pd.Timestamp(start) + pd.to_timedelta(session * 3, unit="D")
+    game_number = np.arange(n_games) - np.searchsorted(session, session)
+    match_ids = [f"{date:%m%d%Y}_{i}" for date, i in zip(dates, game_number)]
+    lineups = np.argsort(rng.random((n_games, len(PLAYERS))), axis=1)[:, :4]
+    losing_score = rng.integers(5, 20, n_games)
+
+    # players
+    names = np.array(PLAYERS)[lineups].ravel()
+    partners = np.array(PLAYERS)[lineups[:, [1, 0, 3, 2]]].ravel()
+    win = np.tile([True, True, False, False], n_games)
+    points_for = np.where(win, 21, np.repeat(losing_score, 4))
+    points_against = np.where(win, np.repeat(losing_score, 4), 21)
+
+    # box score
+    serves = rng.integers(0, 12, n)
+    aces = rng.integers(0, 4, n)
+    missed_serves = np.minimum(rng.integers(0, 4, n), serves)
+    swings = rng.integers(0, 15, n)
+    swing_kills = (rng.random(n) * (swings + 1)).astype(int)
+    hitting_errors = np.minimum(rng.integers(0, 4, n), swings - swing_kills)
+    blocks = rng.integers(0, 3, n)
+    block_kills = (rng.random(n) * (blocks + 1)).astype(int)
+    bump_kills = rng.integers(0, 2, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        serving_percentage = np.where(serves > 0, (serves - missed_serves) / serves, np.nan)
+        hitting_efficiency = np.where(swings > 0, (swing_kills - hitting_errors) / swings, np.nan)
+        blocking_efficiency = np.where(blocks > 0, block_kills / blocks, np.nan)
+
+    stats = pd.DataFrame({
+        'date': np.repeat(dates, 4), 'name': names, 'partner': partners,
+        'win_loss': np.where(win, 'win', 'loss'), 'points_for': points_for, 'points_against': points_against,
+        'match_id': np.repeat(match_ids, 4), 'tournament': np.nan,
+        'serves': serves, 'aces': aces, 'missed_serves': missed_serves, 'received': rng.integers(0, 10, n),
+        'swings': swings, 'swing_kills': swing_kills, 'blocks': blocks, 'block_kills': block_kills,
+        'bump_kills': bump_kills, 'hitting_errors': hitting_errors, 'errors': missed_serves + hitting_errors,
+        'serving_percentage': serving_percentage, 'kills': swing_kills + block_kills + bump_kills,
+        'hitting_efficiency': hitting_efficiency, 'blocking_efficiency': blocking_efficiency,
+        'serve_receive_rating': rng.random(n) * 3, 'effectiveness': rng.integers(-3, 10, n),
+        'positive': rng.integers(0, 5, n), 'pass_rating': rng.random(n) * 3,
+    })
+
+    # switches every 7 combined points with the winning team's score first
+    n_switches = (21 + losing_score) // 7
+    for i in range(8):
+        total = 7 * (i + 1)
+        winner_score = np.round(total * 21 / (21 + losing_score)).astype(int)
+        switch = pd.Series([f"{w} - {total - w}" for w in winner_score], dtype=object)
+        switch[(n_switches <= i)] = np.nan
+        stats[f"switch{i+1}"] = np.repeat(switch.values, 4)
+
+    return stats[STATS_COLUMNS]
+
+def make_plays(stats, seed=0, plays_per_sheet=0.05):
+    """
+    Makes synthetic play sheets for a sample of the games in the stats sheet
+
+    Parameters
+    ----------
+    stats : DataFrame
+        output of make_stats
+    seed : int, default 0
+        seed for the random number generator
+    plays_per_sheet : float, default 0.05
+        number of plays on each sheet per game
+
+    Returns
+    -------
+    <plays> : dict
+        DataFrame of each play sheet keyed by the sheet name
+    """
+    rng = np.random.default_rng(seed + 1)
+    games = stats.iloc[::4]
+    plays = {}
+    for sheet in PLAY_SHEETS:
+        rows = np.sort(rng.choice(len(stats), max(int(len(games) * plays_per_sheet), 1)))
+        minutes = rng.integers(0, 24, len(rows))
+        seconds = rng.integers(0, 60, len(rows))
+        plays[sheet] = pd.DataFrame({
+            'date': stats['date'].values[rows], 'match_id': stats['match_id'].values[rows], 'name': stats['name'].values[rows],
+            # the workbooks store MM:SS into the video in the hour and minute fields
+            'timestamp': [time(int(m), int(s)) for m, s in zip(minutes, seconds)],
+        })
+
+    return plays
+
+def write_workbook(path, sheets):
+    """
+    Writes DataFrames to a workbook row by row without holding the whole workbook in memory
+
+    Parameters
+    ----------
+    path : str
+        location of the workbook
+    sheets : dict
+        DataFrame of each sheet keyed by the sheet name, in order
+    """
+    wb = Workbook(write_only=True)
+    for sheet, df in sheets.items():
+        ws = wb.create_sheet(sheet)
+        ws.append(list(df.columns))
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+
+    tmp_path = f"{path}.tmp"
+    wb.save(tmp_path)
+    os.replace(tmp_path, path)
+
+def generate(n_rows, out_dir, seed=0):
+    """
+    Writes a master workbook and the two latest snapshots for a benchmark size
+
+    Parameters
+    ----------
+    n_rows : int
+        number of rows in the stats sheet
+    out_dir : str
+        directory to write the workbooks to - stands in for the project's data/ directory
+    seed : int, default 0
+        seed for the random number generator
+
+    Creates
+    -------
+    pickup_stats.xlsx
+        master workbook with the stats sheet and every play sheet
+    pickup_stats_<latest>.xlsx
+        snapshot covering every game
+    pickup_stats_<previous>.xlsx
+        snapshot covering every game before the last session
+
+    Returns
+    -------
+    <date_str> : str
+        date of the latest snapshot in form "%m%d%Y"
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stats = make_stats(n_rows, seed=seed)
+    sessions = stats['date'].unique()
+    latest, previous = pd.Timestamp(sessions[-1]), pd.Timestamp(sessions[-2] if len(sessions) > 1 else sessions[-1] - timedelta(days=3))
+
+    write_workbook(f"{out_dir}/pickup_stats.xlsx", {"stats": stats, **make_plays(stats, seed=seed)})
+    # the stats sheet comes first so the master workbook doubles as the latest snapshot
+    shutil.copyfile(f"{out_dir}/pickup_stats.xlsx", f"{out_dir}/pickup_stats_{latest:%m%d%Y}.xlsx")
+    write_workbook(f"{out_dir}/pickup_stats_{previous:%m%d%Y}.xlsx", {"stats": stats[(stats['date'] <= previous)]})
+    return f"{latest:%m%d%Y}"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', help='benchmark sizes to generate', nargs='+', choices=list(SIZES), default=["1k", "10k"])
+    parser.add_argument('-o', help='directory to write a subdirectory of workbooks per size to', default=f"{PROJECT_DIR}/benchmarks/data", type=str)
+    parser.add_argument('--seed', help='seed for the random number generator', default=0, type=int)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        date_str = generate(SIZES[size], f"{args.o}/{size}", seed=args.seed)
+        print(f"{size}: {args.o}/{size} (latest snapshot {date_str})")
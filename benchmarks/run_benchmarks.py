@@ -0,0 +1,263 @@
+import os, sys
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import platform
+import subprocess
+import statistics
+import tempfile
+import time
+
+import pandas as pd, numpy as np
+from datetime import datetime
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+sys.path.append(f"{PROJECT_DIR}/src")
+sys.path.append(f"{PROJECT_DIR}/benchmarks")
+import data_cache
+from generate_report import Report
+from match_summary import MatchSummary
+from snapshot_catalog import SnapshotCatalog
+from leaderboard import build_leaderboards
+from report_renderer import render_report
+from generate_data import SIZES, generate
+
+# stages timed for every size, in the order they run
+STAGES = ["load_workbook", "report_init", "calculate_per_game_stats", "compare_stats", "get_winningest_team",
+          "plot_stats_over_time", "render_template", "match_summary_init", "generate_video_description"]
+# command line runs timed from a fresh interpreter - the workbook cache is already warm
+COLD_START_MODES = {
+    "import": ["-c", "import generate_report"],
+    "stats_only": ["src/generate_report.py", "--stats-only"],
+    "no_figures": ["src/generate_report.py", "--no-pdf", "--no-figures"],
+    "no_pdf": ["src/generate_report.py", "--no-pdf"],
+    "match_summary": ["src/match_summary.py"],
+}
+
+def get_commit():
+    """
+    Gets the current commit and whether the working tree has uncommitted changes
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_DIR, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+    return commit, dirty
+
+def timed(func, *args, **kwargs):
+    """
+    Calls a function and gets how long it took
+
+    Returns
+    -------
+    <seconds> : float
+        wall time of the call
+    <result> : any
+        return value of the call
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def summarize(runs):
+    """
+    Summarizes the timings of a stage
+    """
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+def run_size(data_dir, date_str, repeat=3, n_descriptions=20):
+    """
+    Times every stage on one benchmark size
+
+    Each repeat builds a new Report so the per-report caches never carry over between runs. The
+    workbook cache is cleared once before the first run so load_workbook measures the Excel parse
+    along with indexing the snapshots.
+
+    Parameters
+    ----------
+    data_dir : str
+        directory holding the generated workbooks
+    date_str : str
+        report date in form "%m%d%Y"
+    repeat : int, default 3
+        number of times to run each stage
+    n_descriptions : int, default 20
+        number of video descriptions generated per run
+
+    Returns
+    -------
+    <results> : dict
+        number of rows and a summary of the timings of each stage
+    """
+    runs = {stage: [] for stage in STAGES}
+    data_cache.invalidate(cache_dir=f"{data_dir}/.cache")
+    if os.path.exists(f"{data_dir}/snapshots.json"):
+        os.remove(f"{data_dir}/snapshots.json")
+    paths = sorted(f"{path}" for path in pathlib.Path(data_dir).glob("pickup_stats*.xlsx"))
+    seconds, _ = timed(lambda: (data_cache.warm(paths), SnapshotCatalog(data_dir=data_dir)))
+    runs["load_workbook"].append(seconds)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        os.makedirs(f"{output_dir}/figures")
+        os.makedirs(f"{output_dir}/reports")
+        for _ in range(repeat):
+            seconds, report = timed(Report, date_str, data_dir=data_dir, output_dir=output_dir)
+            runs["report_init"].append(seconds)
+            seconds, stats_per_game = timed(report.calculate_per_game_stats)
+            runs["calculate_per_game_stats"].append(seconds)
+            seconds, changes = timed(report.compare_stats)
+            runs["compare_stats"].append(seconds)
+            seconds, _ = timed(report.get_winningest_team)
+            runs["get_winningest_team"].append(seconds)
+            seconds, _ = timed(report.plot_stats_over_time, stats_per_game['name'].iloc[0])
+            runs["plot_stats_over_time"].append(seconds)
+
+            # only the rendering itself - the stats behind the context are timed above
+            context = report.get_template_context(build_leaderboards(stats_per_game, changes))
+            seconds, _ = timed(render_report, f"{PROJECT_DIR}/templates", 'stat_update_template.html',
+                f"{output_dir}/reports/hlb_report-{report.date}.html", context, cache_dir=f"{data_dir}/.cache/templates")
+            runs["render_template"].append(seconds)
+
+            seconds, summary = timed(MatchSummary, None, data_dir=data_dir)
+            runs["match_summary_init"].append(seconds)
+            match_ids = list(summary.match_index["stats"])[-n_descriptions:]
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds, _ = timed(lambda: [summary.generate_video_description(match_id) for match_id in match_ids])
+            runs["generate_video_description"].append(seconds / len(match_ids))
+
+    return {"rows": len(report.data), "stages": {stage: summarize(stage_runs) for stage, stage_runs in runs.items()}}
+
+def time_cold_starts(data_dir, date_str, match_id, repeat=3):
+    """
+    Times each of the COLD_START_MODES from a fresh interpreter, with empty figure and report directories every run
+
+    Parameters
+    ----------
+    data_dir : str
+        directory holding the generated workbooks
+    date_str : str
+        report date in form "%m%d%Y"
+    match_id : str
+        match to describe in the match_summary mode
+    repeat : int, default 3
+        number of times to run each mode
+
+    Returns
+    -------
+    <results> : dict
+        summary of the timings of each mode
+    """
+    env = {**os.environ, "PYTHONPATH": f"{PROJECT_DIR}/src", "MPLBACKEND": "Agg"}
+    runs = {mode: [] for mode in COLD_START_MODES}
+    for _ in range(repeat):
+        for mode, args in COLD_START_MODES.items():
+            with tempfile.TemporaryDirectory() as output_dir:
+                os.makedirs(f"{output_dir}/figures")
+                os.makedirs(f"{output_dir}/reports")
+                if mode == "match_summary":
+                    args = args + ["-i", match_id, "--data-dir", data_dir]
+                elif mode != "import":
+                    args = args + ["-d", date_str, "--data-dir", data_dir, "--output-dir", output_dir]
+                seconds, _ = timed(subprocess.run, [sys.executable] + args, cwd=PROJECT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+                runs[mode].append(seconds)
+
+    return {mode: summarize(mode_runs) for mode, mode_runs in runs.items()}
+
+def run_benchmarks(sizes, data_root, repeat=3, regenerate=False):
+    """
+    Runs the benchmarks for several sizes, generating any missing workbooks
+
+    Parameters
+    ----------
+    sizes : list of str
+        keys of SIZES to run
+    data_root : str
+        directory holding a subdirectory of workbooks per size
+    repeat : int, default 3
+        number of times to run each stage
+    regenerate : boolean, default False
+        whether to rewrite the workbooks even if they already exist
+
+    Returns
+    -------
+    <results> : dict
+        timings per size along with the commit and environment they were measured on
+    """
+    commit, dirty = get_commit()
+    results = {
+        "commit": commit, "dirty": dirty, "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+        "machine": platform.machine(), "cpu_count": os.cpu_count(), "repeat": repeat, "sizes": {},
+    }
+    for size in sizes:
+        data_dir = f"{data_root}/{size}"
+        if regenerate or not os.path.exists(f"{data_dir}/pickup_stats.xlsx"):
+            print(f"Generating {size} workbooks")
+            generate(SIZES[size], data_dir)
+        # the latest snapshot is the newest dated workbook
+        date_str = max((path.stem.split("_")[-1] for path in pathlib.Path(data_dir).glob("pickup_stats_*.xlsx")),
+                       key=lambda date_str: datetime.strptime(date_str, '%m%d%Y'))
+        print(f"Running {size}")
+        results["sizes"][size] = run_size(data_dir, date_str, repeat=repeat)
+        match_id = MatchSummary(None, data_dir=data_dir).select_matches()[0]
+        results["sizes"][size]["cold_start"] = time_cold_starts(data_dir, date_str, match_id, repeat=repeat)
+
+    return results
+
+def compare(baseline, candidate):
+    """
+    Prints the change in the median time of every stage between two results files
+
+    Parameters
+    ----------
+    baseline : dict
+        results from the earlier commit
+    candidate : dict
+        results from the later commit
+    """
+    print(f"{(baseline['commit'] or '?')[:7]} -> {(candidate['commit'] or '?')[:7]}")
+    print(f"{'size':<6}{'stage':<28}{'before':>10}{'after':>10}{'ratio':>8}")
+    for size, size_results in candidate["sizes"].items():
+        if size not in baseline["sizes"]:
+            continue
+        for group in ("stages", "cold_start"):
+            for stage, stage_results in size_results.get(group, {}).items():
+                before = baseline["sizes"][size].get(group, {}).get(stage)
+                if before is None:
+                    continue
+                after = stage_results["median"]
+                ratio = after / before["median"] if before["median"] else float("nan")
+                print(f"{size:<6}{stage if group == 'stages' else f'cold_start:{stage}':<28}{before['median']:>10.4f}{after:>10.4f}{ratio:>8.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', help='benchmark sizes to run', nargs='+', choices=list(SIZES), default=["1k", "10k"])
+    parser.add_argument('-r', help='number of times to run each stage', default=3, type=int)
+    parser.add_argument('--data', help='directory holding a subdirectory of workbooks per size', default=f"{PROJECT_DIR}/benchmarks/data", type=str)
+    parser.add_argument('--regenerate', help='rewrite the workbooks even if they already exist', action='store_true')
+    parser.add_argument('-o', help='results file - defaults to benchmarks/results/<commit>-<time>.json', default=None, type=str)
+    parser.add_argument('--compare', help='compare two results files instead of running the benchmarks', nargs=2, metavar=('BASELINE', 'CANDIDATE'))
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_baseline, open(args.compare[1]) as f_candidate:
+            compare(json.load(f_baseline), json.load(f_candidate))
+    else:
+        results = run_benchmarks(args.sizes, args.data, repeat=args.r, regenerate=args.regenerate)
+        out_path = args.o
+        if out_path is None:
+            os.makedirs(f"{PROJECT_DIR}/benchmarks/results", exist_ok=True)
+            out_path = f"{PROJECT_DIR}/benchmarks/results/{(results['commit'] or 'unknown')[:7]}-{datetime.now():%Y%m%d%H%M%S}.json"
+        with open(out_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+        for size, size_results in results["sizes"].items():
+            for stage, stage_results in size_results["stages"].items():
+                print(f"{size:<6}{stage:<28}{stage_results['median']:>10.4f}")
+            for mode, mode_results in size_results["cold_start"].items():
+                print(f"{size:<6}{f'cold_start:{mode}':<28}{mode_results['median']:>10.4f}")
+        print(f"Results saved to {out_path}")
@@ -0,0 +1,198 @@
+import os
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import pathlib
+import shutil
+
+import pandas as pd, numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+CACHE_DIR = f"{PROJECT_DIR}/data/.cache"
+
+def get_cache_dir(path):
+    """
+    Gets the default cache directory for a workbook - a .cache directory next to it
+    """
+    return f"{pathlib.Path(path).resolve().parent}/.cache"
+
+def get_entry_dir(path, cache_dir=None):
+    """
+    Gets the cache directory for the current version of a workbook
+
+    Parameters
+    ----------
+    path : str
+        location of the Excel workbook
+    cache_dir : str, default None
+        root directory of the cache. If None, the .cache directory next to the workbook
+
+    Returns
+    -------
+    <entry_dir> : str
+        directory holding one Feather file per sheet - keyed on the resolved
+        path, size, and modification time of the workbook so edits to the
+        workbook naturally miss the cache
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir(path)
+    path = pathlib.Path(path).resolve()
+    stat = path.stat()
+    key = hashlib.sha1(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+    return f"{cache_dir}/{path.stem}-{key}"
+
+def _load_entry(entry_dir):
+    """
+    Memory-maps every sheet of a cache entry back into DataFrames
+    """
+    import pyarrow.feather as feather # only needed once there is a cache entry
+
+    with open(f"{entry_dir}/sheets.json") as f:
+        sheet_names = json.load(f)["sheets"]
+
+    sheets = {}
+    for i, sheet in enumerate(sheet_names):
+        df = feather.read_table(f"{entry_dir}/{i}.feather", memory_map=True).to_pandas()
+        # Arrow hands back missing strings as None - the rest of the code expects NaN
+        object_columns = df.select_dtypes(include="object").columns
+        df[object_columns] = df[object_columns].where(df[object_columns].notna(), np.nan)
+        sheets[sheet] = df
+
+    return sheets
+
+def _write_entry(path, sheets, cache_dir=None):
+    """
+    Writes every sheet of a workbook to a new cache entry and removes stale entries for the same workbook
+    """
+    import pyarrow as pa, pyarrow.feather as feather # only needed once there is a workbook to cache
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir(path)
+    source = f"{pathlib.Path(path).resolve()}"
+    entry_dir = get_entry_dir(path, cache_dir=cache_dir)
+    tmp_dir = f"{cache_dir}/.tmp-{os.path.basename(entry_dir)}-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        for i, df in enumerate(sheets.values()):
+            # uncompressed so the file can be memory-mapped on the way back in
+            feather.write_feather(df, f"{tmp_dir}/{i}.feather", compression="uncompressed")
+    except (pa.ArrowException, ValueError, TypeError) as e:
+        logger.warning(f"Unable to cache {source}: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+
+    with open(f"{tmp_dir}/sheets.json", "w") as f:
+        json.dump({"source": source, "sheets": list(sheets.keys())}, f)
+
+    invalidate(path, cache_dir=cache_dir)
+    os.replace(tmp_dir, entry_dir)
+
+def read_excel(path, sheet_name=0, parse_dates=None, use_cache=True, cache_dir=None):
+    """
+    Reads a sheet from an Excel workbook, going through the columnar cache when possible
+
+    Parameters
+    ----------
+    path : str
+        location of the Excel workbook
+    sheet_name : str, int, or None, default 0
+        sheet to read - either the name, the position, or None for all sheets
+    parse_dates : list of str, default None
+        columns to convert to datetimes
+    use_cache : boolean, default True
+        whether to use the cache or go straight to the workbook
+    cache_dir : str, default None
+        root directory of the cache. If None, the .cache directory next to the workbook
+
+    Returns
+    -------
+    <data> : DataFrame or dict of DataFrame
+        the requested sheet or, when sheet_name is None, every sheet keyed by name
+    """
+    sheets = None
+    if use_cache:
+        entry_dir = get_entry_dir(path, cache_dir=cache_dir)
+        if os.path.exists(f"{entry_dir}/sheets.json"):
+            sheets = _load_entry(entry_dir)
+        else:
+            logger.info(f"Cache miss for {path} - parsing the workbook")
+
+    if sheets is None:
+        # parsing every sheet on a miss means one trip through openpyxl fills the whole entry
+        sheets = pd.read_excel(path, sheet_name=None)
+        if use_cache:
+            _write_entry(path, sheets, cache_dir=cache_dir)
+
+    for df in sheets.values():
+        for col in parse_dates if parse_dates else []:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+
+    if sheet_name is None:
+        return sheets
+    elif isinstance(sheet_name, int):
+        return list(sheets.values())[sheet_name]
+    else:
+        return sheets[sheet_name]
+
+def invalidate(path=None, cache_dir=None):
+    """
+    Removes cache entries
+
+    Parameters
+    ----------
+    path : str, default None
+        workbook to remove the entries for. If None, the entire cache is removed
+    cache_dir : str, default None
+        root directory of the cache. If None, the .cache directory next to the
+        workbook or CACHE_DIR when no workbook is given
+    """
+    if path is None:
+        shutil.rmtree(cache_dir if cache_dir is not None else CACHE_DIR, ignore_errors=True)
+        return
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir(path)
+
+    source = f"{pathlib.Path(path).resolve()}"
+    for entry_dir in glob.glob(f"{cache_dir}/{pathlib.Path(path).stem}-*"):
+        try:
+            with open(f"{entry_dir}/sheets.json") as f:
+                if json.load(f)["source"] != source:
+                    continue
+        except (OSError, ValueError, KeyError):
+            pass # unreadable entries are removed as well
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+def warm(paths, cache_dir=None):
+    """
+    Makes sure every workbook has an up-to-date cache entry
+
+    Parameters
+    ----------
+    paths : list of str
+        workbooks to cache
+    """
+    for path in paths:
+        read_excel(path, sheet_name=None, cache_dir=cache_dir)
+        print(f"Cached {path}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', help='warm creates missing cache entries and invalidate removes them', choices=['warm', 'invalidate'])
+    parser.add_argument('paths', help='workbooks to act on - defaults to data/pickup_stats*.xlsx', nargs='*')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    paths = args.paths if args.paths else sorted(glob.glob(f"{PROJECT_DIR}/data/pickup_stats*.xlsx"))
+    if args.action == 'warm':
+        warm(paths)
+    elif args.paths:
+        for path in paths:
+            invalidate(path)
+    else:
+        invalidate()
@@ -0,0 +1,205 @@
+import os
+import hashlib
+import json
+import logging
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# stats shown in the over-time figures and their y-axis limits - None scales the axis to the player's values
+PLOT_VARIABLES = ['win_rate', 'hitting_efficiency', 'effectiveness', 'serving_percentage', 'serve_receive_rating', 'errors', 'rating']
+PLOT_LIMITS = [[0, 100], [0, 1], [0, 10], [0.5, 1], [0, 3], [0, 7], None]
+# bump whenever the look of the figures changes so every cached figure is re-rendered
+STYLE_VERSION = 2
+MANIFEST_FILE = "figure_manifest.json"
+
+# figure and axes reused for every player rendered by this process
+_template = None
+
+def _get_template():
+    """
+    Gets the styled figure and axes for this process, creating them on first use
+
+    Returns
+    -------
+    <fig> : matplotlib.figure.Figure
+        figure shared by every render in this process
+    <axes> : array of matplotlib.axes.Axes
+        axes with the locators, limits, titles, and spines already set
+    """
+    global _template
+    if _template is None:
+        # matplotlib is only imported once there is a figure to draw
+        import matplotlib.dates as mdates
+        from matplotlib.figure import Figure
+
+        # built outside of pyplot so it is never tied to a GUI backend or closed between renders
+        n_rows = (len(PLOT_VARIABLES) + 1) // 2
+        fig = Figure(figsize=(10, 4 * n_rows))
+        axes = fig.subplots(n_rows, 2, sharex=True)
+        for ax in axes.flat[len(PLOT_VARIABLES):]:
+            ax.set_visible(False)
+        # the shared dates are labelled on the last axes in each column
+        for ax in axes.flat[len(PLOT_VARIABLES) - 2:len(PLOT_VARIABLES)]:
+            ax.tick_params(axis='x', which='both', labelbottom=True)
+        for variable, limit, ax in zip(PLOT_VARIABLES, PLOT_LIMITS, axes.flat):
+            ax.xaxis.set_major_locator(mdates.MonthLocator())
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
+            ax.xaxis.set_minor_locator(mdates.DayLocator(interval=7))
+            ax.xaxis.set_minor_formatter(mdates.DateFormatter('%d'))
+            if limit is not None:
+                ax.set_ylim(limit)
+            ax.tick_params(axis='x', labelsize=12)
+            ax.tick_params(axis='x', which="major",labelsize=14,pad=10)
+            ax.tick_params(axis='y', labelsize=14)
+            ax.set_title((variable.replace('_', ' ').title()), fontsize=18)
+
+            for loc in ('top', 'right'):
+                ax.spines[loc].set_visible(False)
+
+        _template = (fig, axes)
+
+    return _template
+
+def _init_worker():
+    """
+    Switches worker processes to the non-interactive backend before anything is drawn
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+def render_player_figure(player, player_stats, path):
+    """
+    Draws a player's running stats onto the template figure and saves it
+
+    Parameters
+    ----------
+    player : str
+        name of the player
+    player_stats : DataFrame
+        running stats indexed by date with a column for each of PLOT_VARIABLES
+    path : str
+        location to save the PNG to
+
+    Returns
+    -------
+    player : str
+        name of the player
+    <error> : str or None
+        description of the failure or None if the figure was saved
+    """
+    try:
+        fig, axes = _get_template()
+        for variable, limit, ax in zip(PLOT_VARIABLES, PLOT_LIMITS, axes.flat):
+            for line in list(ax.lines): # clearing the previous player
+                line.remove()
+            ax.plot(player_stats.index, player_stats[variable], lw=3, color='black')
+            ax.relim()
+            ax.autoscale_view(scalex=True, scaley=limit is None)
+
+        fig.savefig(path)
+    except Exception as e:
+        return player, f"{type(e).__name__}: {e}"
+
+    return player, None
+
+def get_figure_key(player_stats):
+    """
+    Gets the cache key for a player's figure
+
+    Parameters
+    ----------
+    player_stats : DataFrame
+        running stats indexed by date - the only data the figure is drawn from
+
+    Returns
+    -------
+    <key> : str
+        hash of the plotted values and the plotting parameters
+    """
+    sha = hashlib.sha1()
+    sha.update(pd.util.hash_pandas_object(player_stats, index=True).values.tobytes())
+    sha.update(json.dumps({"variables": PLOT_VARIABLES, "limits": PLOT_LIMITS, "style": STYLE_VERSION}).encode())
+    return sha.hexdigest()
+
+def load_manifest(figures_dir):
+    """
+    Gets the figure keys recorded in the figures directory
+    """
+    try:
+        with open(f"{figures_dir}/{MANIFEST_FILE}") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(figures_dir, manifest):
+    """
+    Records the figure keys in the figures directory
+    """
+    tmp_path = f"{figures_dir}/{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    os.replace(tmp_path, f"{figures_dir}/{MANIFEST_FILE}")
+
+def render_figures(stats_over_time, players, figures_dir, n_workers=1, use_cache=True):
+    """
+    Renders the over-time figure for each player, in parallel when more than one worker is requested
+
+    Parameters
+    ----------
+    stats_over_time : DataFrame
+        running stats indexed by name and date
+    players : list of str
+        players to render figures for
+    figures_dir : str
+        directory to save the figures to
+    n_workers : int, default 1
+        number of processes to render with - 1 renders in this process
+    use_cache : boolean, default True
+        whether to skip players whose figure key matches the manifest
+
+    Returns
+    -------
+    <errors> : dict
+        players whose figure failed mapped to a description of the failure
+    """
+    players_with_stats = set(stats_over_time.index.get_level_values('name'))
+    manifest = load_manifest(figures_dir) if use_cache else {}
+    keys = {}
+    tasks = []
+    for player in players:
+        if player not in players_with_stats:
+            continue
+        path = f"{figures_dir}/{player}-stats_over_time.png"
+        keys[player] = get_figure_key(stats_over_time.loc[player])
+        if manifest.get(player) == keys[player] and os.path.exists(path):
+            logger.info(f"Using cached figure for {player}")
+        else:
+            tasks.append((player, stats_over_time.loc[player], path))
+
+    errors = {}
+    if n_workers <= 1:
+        results = [render_player_figure(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, os.cpu_count() or 1), initializer=_init_worker) as pool:
+            futures = [pool.submit(render_player_figure, *task) for task in tasks]
+            results = [future.result() for future in as_completed(futures)]
+
+    results += [(player, "no games to plot") for player in players if player not in players_with_stats]
+    for player, error in results:
+        if error is None:
+            logger.info(f"Rendered figure for {player}")
+            manifest[player] = keys[player]
+        else:
+            logger.error(f"Unable to render figure for {player}: {error}")
+            manifest.pop(player, None)
+            errors[player] = error
+
+    if tasks:
+        save_manifest(figures_dir, manifest)
+
+    return errors
@@ -0,0 +1,274 @@
+import os, sys
+import argparse
+import logging
+import pathlib
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd, numpy as np
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.fitbit_data
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+CACHE_DIR = f"{PROJECT_DIR}/data/fitbit"
+# finest detail level first - coarser levels are used when an account cannot access the finer ones
+DETAIL_LEVELS = ("1sec", "1min", "15min")
+# stay well below the hourly request limit of the Fitbit API
+N_WORKERS = 4
+
+def connect(client_id, client_secret, redirect_uri='http://127.0.0.1:8080/'):
+    """
+    Authorizes with Fitbit through the browser and gets a client for the user
+
+    Parameters
+    ----------
+    client_id : str
+        Fitbit application's client ID
+    client_secret : str
+        Fitbit application's client secret
+    redirect_uri : str, default 'http://127.0.0.1:8080/'
+        where the authorization is sent - must match the Fitbit application
+
+    Returns
+    -------
+    <client> : fitbit.Fitbit
+        authorized client
+    """
+    # the OAuth helper lives with the notebooks and needs cherrypy and python-fitbit
+    sys.path.append(f"{PROJECT_DIR}/notebooks")
+    import fitbit
+    from gather_keys_oauth2 import OAuth2Server
+
+    server = OAuth2Server(client_id, client_secret, redirect_uri=redirect_uri)
+    server.browser_authorize()
+    token = server.fitbit.client.session.token
+    return fitbit.Fitbit(client_id, client_secret, oauth2=True,
+                         access_token=str(token['access_token']), refresh_token=str(token['refresh_token']))
+
+class FakeFitbitClient:
+
+    def __init__(self, seed=0, detail_levels=DETAIL_LEVELS) -> None:
+        """
+        Stands in for fitbit.Fitbit without a network connection, returning the same response shape
+
+        Parameters
+        ----------
+        seed : int, default 0
+            seed for the generated values - the same seed, resource, and date always give the same series
+        detail_levels : tuple of str, default DETAIL_LEVELS
+            detail levels the fake account can access - requests for any other level raise
+
+        Creates
+        -------
+        calls : list of tuple
+            (resource, date, detail level) of every request made
+        """
+        self.seed = seed
+        self.detail_levels = detail_levels
+        self.calls = []
+
+    def intraday_time_series(self, resource, base_date='today', detail_level='1min', start_time=None, end_time=None):
+        """
+        Generates a day of intraday values in the shape the Fitbit API returns them
+        """
+        self.calls.append((resource, f"{base_date}", detail_level))
+        if detail_level not in self.detail_levels:
+            raise ValueError(f"Detail level {detail_level} is not available")
+
+        name = resource.split('/')[-1]
+        step = {"1sec": 1, "1min": 60, "15min": 900}[detail_level]
+        seconds = np.arange(0, 86400, step)
+        rng = np.random.default_rng([self.seed, sum(map(ord, name)), pd.Timestamp(base_date).toordinal()])
+        values = rng.poisson(0.05, len(seconds)) * (10 if name == "elevation" else 1)
+        times = [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in seconds]
+        return {
+            f"activities-{name}": [{"dateTime": f"{pd.Timestamp(base_date).date()}", "value": f"{values.sum()}"}],
+            f"activities-{name}-intraday": {
+                "dataset": [{"time": t, "value": int(v)} for t, v in zip(times, values)],
+                "datasetInterval": 1 if detail_level == "1sec" else step // 60,
+                "datasetType": "second" if detail_level == "1sec" else "minute",
+            },
+        }
+
+def parse_intraday(raw, resource, day):
+    """
+    Converts an intraday response to a series indexed by time, building every timestamp at once
+
+    Parameters
+    ----------
+    raw : dict
+        response from intraday_time_series
+    resource : str
+        resource that was requested e.g. "floors"
+    day : datetime.date
+        date that was requested
+
+    Returns
+    -------
+    <series> : Series
+        values named after the resource and indexed by timestamp
+    """
+    dataset = raw[f"activities-{resource}-intraday"]["dataset"]
+    times = np.array([point["time"] for point in dataset], dtype="U8")
+    if len(times) > 0 and (np.char.str_len(times) == 8).all():
+        # "HH:MM:SS" - every character's code point minus "0" gives the digit
+        digits = times.view(np.uint32).reshape(-1, 8).astype(np.int64) - ord("0")
+        seconds = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60 + digits[:, 6] * 10 + digits[:, 7]
+        offsets = pd.to_timedelta(seconds, unit="s")
+    else:
+        offsets = pd.to_timedelta(pd.Series(times, dtype=object))
+    index = pd.DatetimeIndex(pd.Timestamp(day) + offsets, name="time")
+    return pd.Series([point["value"] for point in dataset], index=index, name=resource, dtype=float)
+
+def get_cache_path(day, resource, detail_level, account, cache_dir=CACHE_DIR):
+    """
+    Gets the location of a cached intraday series - each account has its own directory so one wearer's
+    series is never returned for another
+    """
+    if account is None:
+        raise ValueError("An account is needed to cache intraday series")
+    return f"{cache_dir}/{account}/{resource}-{day:%Y%m%d}-{detail_level}.feather"
+
+def _load_cached(path):
+    """
+    Reads a cached intraday series back into a series indexed by timestamp
+    """
+    import pyarrow.feather as feather # only needed once there is a cached series
+
+    table = feather.read_table(path).to_pandas()
+    return table.set_index("time")[table.columns[-1]]
+
+def _write_cached(path, series):
+    """
+    Writes an intraday series to the cache through a temporary file so concurrent readers never see it half written
+    """
+    import pyarrow as pa, pyarrow.feather as feather # only needed once there is a series to cache
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    feather.write_feather(pa.Table.from_pandas(series.reset_index(), preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+def get_intraday(client, day, resource, detail_level="1sec", cache_dir=CACHE_DIR, account=None):
+    """
+    Gets a day of intraday values for a resource, only downloading it if it is not cached
+
+    Levels coarser than the requested one are tried in turn if the account cannot access it. Days that
+    are not over yet are never cached since they are still missing data.
+
+    Parameters
+    ----------
+    client : fitbit.Fitbit or FakeFitbitClient
+        anything with the intraday_time_series method of fitbit.Fitbit
+    day : datetime.date
+        date to get
+    resource : str
+        activity resource e.g. "floors" or "elevation"
+    detail_level : str, default "1sec"
+        finest detail level to get - one of DETAIL_LEVELS
+    cache_dir : str, default CACHE_DIR
+        directory to cache the series in or None to always download
+    account : str, default None
+        Fitbit account the client is authorized for e.g. its user ID or the wearer's name - needed
+        unless cache_dir is None
+
+    Returns
+    -------
+    <series> : Series
+        values named after the resource and indexed by timestamp
+    <detail_level> : str
+        detail level the series was recorded at
+    """
+    day = pd.Timestamp(day).date()
+    levels = DETAIL_LEVELS[DETAIL_LEVELS.index(detail_level):]
+    if cache_dir is not None:
+        for level in levels:
+            path = get_cache_path(day, resource, level, account, cache_dir)
+            if os.path.exists(path):
+                return _load_cached(path), level
+
+    error = None
+    for level in levels:
+        try:
+            raw = client.intraday_time_series(f"activities/{resource}", datetime(day.year, day.month, day.day), detail_level=level)
+        except Exception as e:
+            logger.warning(f"Unable to get {resource} at {level} on {day}: {e}")
+            error = e
+            continue
+
+        series = parse_intraday(raw, resource, day)
+        if cache_dir is not None and day < date.today():
+            _write_cached(get_cache_path(day, resource, level, account, cache_dir), series)
+        return series, level
+
+    raise error
+
+def get_intraday_data(client, days, resources, detail_level="1sec", n_workers=N_WORKERS, cache_dir=CACHE_DIR, account=None):
+    """
+    Gets intraday values for several resources and days, downloading whatever is not cached concurrently
+
+    Parameters
+    ----------
+    client : fitbit.Fitbit or FakeFitbitClient
+        anything with the intraday_time_series method of fitbit.Fitbit
+    days : list of datetime.date
+        dates to get
+    resources : list of str
+        activity resources e.g. ["floors", "elevation"]
+    detail_level : str, default "1sec"
+        finest detail level to get
+    n_workers : int, default N_WORKERS
+        number of requests to make at once
+    cache_dir : str, default CACHE_DIR
+        directory to cache the series in or None to always download
+    account : str, default None
+        Fitbit account the client is authorized for - needed unless cache_dir is None
+
+    Returns
+    -------
+    <data> : DataFrame
+        indexed by timestamp with a column per resource - resources recorded at a coarser detail level
+        are NaN between their readings
+    """
+    tasks = [(day, resource) for day in days for resource in resources]
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as pool:
+        results = list(pool.map(lambda task: get_intraday(client, *task, detail_level=detail_level, cache_dir=cache_dir, account=account)[0], tasks))
+
+    columns = {}
+    for (_, resource), series in zip(tasks, results):
+        columns.setdefault(resource, []).append(series)
+
+    return pd.concat({resource: pd.concat(series).sort_index() for resource, series in columns.items()}, axis=1)
+
+def main(days, resources, account, detail_level="1sec", fake=False, n_workers=N_WORKERS, use_cache=True):
+    """
+    Gets the intraday data, authorizing with Fitbit unless the fake client is used
+    """
+    cache_dir = CACHE_DIR if use_cache else None
+    if fake:
+        client = FakeFitbitClient()
+        # kept apart so generated values are never mistaken for downloaded ones
+        cache_dir = f"{CACHE_DIR}/fake" if use_cache else None
+    else:
+        from settings import FITBIT_CLIENT_ID, FITBIT_CLIENT_SECRET # not tracked - holds the Fitbit application keys
+        client = connect(FITBIT_CLIENT_ID, FITBIT_CLIENT_SECRET)
+
+    return get_intraday_data(client, days, resources, detail_level=detail_level, n_workers=n_workers, cache_dir=cache_dir, account=account)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--dates', nargs='+', required=True, help="Dates to get in the format MMDDYYYY", type=str)
+    parser.add_argument('-a', '--account', required=True, help="Name of the Fitbit account e.g. the wearer - each account's data is cached separately", type=str)
+    parser.add_argument('-r', '--resources', nargs='+', default=["floors", "elevation"], help="Activity resources to get", type=str)
+    parser.add_argument('-l', '--detail-level', default="1sec", choices=DETAIL_LEVELS, help="Finest detail level to get")
+    parser.add_argument('-w', '--workers', default=N_WORKERS, help="Number of requests to make at once", type=int)
+    parser.add_argument('--fake', action='store_true', help="Generate the data locally instead of using the Fitbit API")
+    parser.add_argument('--no-cache', action='store_true', help="Always download the data")
+    args = parser.parse_args()
+
+    days = [datetime.strptime(date_str, '%m%d%Y').date() for date_str in args.dates]
+    data = main(days, args.resources, args.account, detail_level=args.detail_level, fake=args.fake, n_workers=args.workers, use_cache=not args.no_cache)
+    print(data.describe())
@@ -0,0 +1,238 @@
+import sys
+import argparse
+import logging
+import pathlib
+import sqlite3
+
+import pandas as pd, numpy as np
+from datetime import time, timedelta
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.game_log
+import data_cache
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+PLAY_SHEETS = ["hammers","monster_blocks","superb_serves","great_defense","wow_plays"]
+
+class GameLog:
+
+    def __init__(self, db_path=f"{PROJECT_DIR}/data/game_log.sqlite") -> None:
+        """
+        Append-only store of every game row and play
+
+        Parameters
+        ----------
+        db_path : str, default PROJECT_DIR/data/game_log.sqlite
+            location of the SQLite database
+
+        Creates
+        -------
+        conn : sqlite3.Connection
+            connection to the database
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+
+    def close(self):
+        """
+        Closes the connection to the database
+        """
+        self.conn.close()
+
+    def get_columns(self, table):
+        """
+        Gets the column names of the given table in order - empty if the table does not exist
+        """
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info("{table}")')]
+
+    def append(self, table, df, index_columns):
+        """
+        Appends rows to a table, creating the table and any new columns as needed
+
+        Parameters
+        ----------
+        table : str
+            name of the table
+        df : DataFrame
+            rows to append
+        index_columns : list of str
+            columns to index
+        """
+        existing_columns = self.get_columns(table)
+        for col in df.columns:
+            if existing_columns and col not in existing_columns:
+                self.conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}"')
+
+        df.to_sql(table, self.conn, if_exists="append", index=False)
+        for col in index_columns:
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table}_{col}" ON "{table}" ("{col}")')
+
+    def get_match_ids(self, table, **filters):
+        """
+        Gets the match IDs already stored in the given table
+        """
+        if not self.get_columns(table):
+            return set()
+
+        where, params = self._build_where(**filters)
+        return {row[0] for row in self.conn.execute(f'SELECT DISTINCT match_id FROM "{table}"{where}', params)}
+
+    def ingest(self, path=f"{PROJECT_DIR}/data/pickup_stats.xlsx"):
+        """
+        Appends any matches from the workbook that are not yet in the store
+
+        Matches are identified by match_id so existing rows are never rewritten - edits to
+        a match that has already been ingested are not picked up.
+
+        Parameters
+        ----------
+        path : str, default PROJECT_DIR/data/pickup_stats.xlsx
+            workbook with the "stats" sheet and, optionally, the play sheets
+
+        Returns
+        -------
+        <n_new> : dict
+            number of rows added per sheet
+        """
+        sheets = data_cache.read_excel(path, sheet_name=None, parse_dates=['date'])
+        n_new = {}
+        with self.conn:
+            stats = sheets["stats"].dropna(subset=['date', 'match_id'])
+            new_stats = stats[(~stats['match_id'].isin(self.get_match_ids("games")))]
+            self.append("games", new_stats, ["date", "name", "match_id"])
+            n_new["stats"] = len(new_stats)
+
+            for sheet in PLAY_SHEETS:
+                if sheet not in sheets:
+                    continue
+                plays = sheets[sheet].dropna(subset=['match_id']).copy()
+                plays = plays[(~plays['match_id'].isin(self.get_match_ids("plays", play=sheet)))]
+                plays.insert(0, "play", sheet)
+                if "timestamp" in plays.columns:
+                    plays["timestamp"] = [ts.isoformat() if isinstance(ts, time) else ts for ts in plays["timestamp"]]
+                self.append("plays", plays, ["play", "match_id"])
+                n_new[sheet] = len(plays)
+
+        return n_new
+
+    def _build_where(self, start=None, end=None, match_id=None, name=None, play=None):
+        """
+        Builds the WHERE clause and parameters for the indexed filters
+        """
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(f"{pd.Timestamp(start)}")
+        if end is not None:
+            clauses.append("date < ?")
+            params.append(f"{pd.Timestamp(end) + timedelta(days=1)}") # end date is inclusive
+        for col, value in (("match_id", match_id), ("name", name), ("play", play)):
+            if value is not None:
+                clauses.append(f"{col} = ?")
+                params.append(value)
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def _query(self, table, **filters):
+        """
+        Gets the rows of a table matching the filters in the order they were ingested
+        """
+        if not self.get_columns(table):
+            raise LookupError(f"No {table} in {self.db_path} - run `python src/game_log.py ingest` first")
+
+        where, params = self._build_where(**filters)
+        df = pd.read_sql_query(f'SELECT * FROM "{table}"{where} ORDER BY rowid', self.conn, params=params, parse_dates=['date'])
+        # SQLite hands back missing text as None - the rest of the code expects NaN
+        object_columns = df.select_dtypes(include="object").columns
+        df[object_columns] = df[object_columns].where(df[object_columns].notna(), np.nan)
+        return df
+
+    def games(self, start=None, end=None, match_id=None, name=None):
+        """
+        Gets game rows using the indexed date, match_id, and name columns
+
+        Parameters
+        ----------
+        start : datetime.date, default None
+            first date to include
+        end : datetime.date, default None
+            last date to include
+        match_id : str, default None
+            only include this match
+        name : str, default None
+            only include this player
+
+        Returns
+        -------
+        <games> : DataFrame
+            one row per player per game in the same layout as the "stats" sheet
+        """
+        return self._query("games", start=start, end=end, match_id=match_id, name=name)
+
+    def as_of(self, date):
+        """
+        Gets all games played on or before the given date
+        """
+        return self.games(end=date)
+
+    def plays(self, play, match_id=None):
+        """
+        Gets the rows from one of the play sheets
+
+        Parameters
+        ----------
+        play : str
+            name of the play sheet e.g. "hammers"
+        match_id : str, default None
+            only include this match
+
+        Returns
+        -------
+        <plays> : DataFrame
+            rows in the same layout as the play sheet
+        """
+        df = self._query("plays", play=play, match_id=match_id).drop(columns="play")
+        if "timestamp" in df.columns:
+            df["timestamp"] = [time.fromisoformat(ts) if isinstance(ts, str) else ts for ts in df["timestamp"]]
+        return df
+
+    def previous_session(self, date):
+        """
+        Gets the date of the last session before the latest session on or before the given date
+
+        Parameters
+        ----------
+        date : datetime.date
+            report date
+
+        Returns
+        -------
+        <previous_date> : datetime.date or None
+            date of the session or None if there is only one session
+        """
+        where, params = self._build_where(end=date)
+        row = self.conn.execute(f'SELECT MAX(date) FROM games WHERE date < (SELECT MAX(date) FROM games{where})', params).fetchone()
+        if row[0] is None:
+            return None
+
+        return pd.Timestamp(row[0]).date()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', help='ingest appends new matches from the workbook and summary lists what is stored', choices=['ingest', 'summary'])
+    parser.add_argument('-f', help='workbook to ingest', default=f"{PROJECT_DIR}/data/pickup_stats.xlsx", type=str)
+    args = parser.parse_args()
+
+    store = GameLog()
+    if args.action == 'ingest':
+        for sheet, n in store.ingest(args.f).items():
+            print(f"{sheet}: {n} new rows")
+    else:
+        for table in ("games", "plays"):
+            if store.get_columns(table):
+                n_rows, n_matches = store.conn.execute(f'SELECT COUNT(*), COUNT(DISTINCT match_id) FROM "{table}"').fetchone()
+                print(f"{table}: {n_rows} rows from {n_matches} matches")
+    store.close()
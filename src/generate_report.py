@@ -1,16 +1,38 @@
 import os, sys
 import argparse
+import cProfile
+import time
 
-import pandas as pd, numpy as np, jinja2, pdfkit
+import pandas as pd, numpy as np
 from datetime import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import logging
 import pathlib
 
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.generate_report
+from stats_engine import calculate_cumulative_stats, calculate_partnership_stats, get_top_partnerships, get_wins
+from schema import apply_stats_schema, get_categories
+import data_cache
+from snapshot_catalog import SnapshotCatalog
+from game_log import GameLog
+from leaderboard import build_leaderboards, get_template_leaderboards
+from report_renderer import render_report
+from pdf_pipeline import PdfConverter, queue_conversion
+from figure_renderer import PLOT_VARIABLES, render_player_figure, render_figures
+from run_metrics import RunMetrics
+from stats_memo import PlayerStatsMemo, MEMO_FILE
+from head_to_head import HeadToHead
+from ratings import RatingEngine, STATE_FILE as RATING_STATE_FILE
+from rolling_form import FormTracker, get_form_leaderboards, FORM_PERCENT_VARIABLES, FORM_WINDOW, STATE_FILE as FORM_STATE_FILE
+
+def slice_as_of(data, date):
+    """
+    Gets the rows of the data played on or before the given date
+    """
+    return data[(data['date'] < pd.Timestamp(date) + pd.Timedelta(days=1))]
+
 class Report:
 
-    def __init__(self, date_str) -> None:
+    def __init__(self, date_str, use_store=False, source_data=None, stats_cache=None, stats_memo=None, data_dir=None, output_dir=None) -> None:
         """
         Initializing Function
 
@@ -18,6 +40,20 @@ class Report:
         ----------
         date_str : str
             specifies date in form "%m%d%Y"
+        use_store : boolean, default False
+            whether to read the data from the game log store rather than the dated workbooks
+        source_data : DataFrame, default None
+            already loaded data covering the report date - the current and previous data are
+            sliced from it in memory instead of being read from disk
+        stats_cache : dict, default None
+            per game stats shared between reports built from the same source_data
+        stats_memo : PlayerStatsMemo, default None
+            per player stats shared between snapshots so only players with new games are calculated. If
+            None, a memo that only lives as long as the report is used
+        data_dir : str, default None
+            directory holding the workbooks. If None, the project's data/ directory is used
+        output_dir : str, default None
+            directory holding the figures/ and reports/ directories. If None, the project directory is used
 
         Creates
         -------
@@ -26,13 +62,30 @@ class Report:
         date : datetime.date
             report date
         previous_data : DataFrame
-            raw data from the previous report
+            raw data from the previous report - loaded on first access
         previous_date : datetime.date
             previous report date
+        snapshot : dict
+            catalog entry of the snapshot taken on the report date or None if there is not one
+        as_of : datetime.date
+            date of the last game the report's data goes up to - the last game in the report date's
+            snapshot if there is one, otherwise the report date
+        previous_as_of : datetime.date
+            date of the last game in the previous report's data
+        metrics : RunMetrics
+            time, row count, and peak memory of each stage - saved next to the report by run()
+        all_data : DataFrame
+            raw data including the players with only a few games
+        rating_engine : RatingEngine
+            doubles ratings up to the report date - rated on first use
+        head_to_head : HeadToHead
+            every player's record with and against every other player - built on first use
         """
         # file paths
         self.path_to_this_dir = f"{pathlib.Path(__file__).resolve().parent}"
         self.project_dir = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+        self.data_dir = data_dir if data_dir is not None else f"{self.project_dir}/data"
+        self.output_dir = output_dir if output_dir is not None else self.project_dir
 
         # setting up logging
         self.logger = logging.getLogger(__name__)
@@ -42,46 +95,103 @@ class Report:
         # Data
         # ----
         # getting current, specified data
-        self.data = pd.read_excel(f"{self.project_dir}/data/pickup_stats_{date_str}.xlsx", parse_dates=['date'])
-        self.data.dropna(subset=['date'], inplace=True)
         self.date = datetime.strptime(date_str, '%m%d%Y').date()
+        self.metrics = RunMetrics(f"{self.date}")
+        self.source_data = source_data
+        self.stats_cache = {} if stats_cache is None else stats_cache
+        self.stats_memo = PlayerStatsMemo() if stats_memo is None else stats_memo
+        self.store = GameLog(f"{self.data_dir}/game_log.sqlite") if use_store else None
+        with self.metrics.span("load_data") as span:
+            # a snapshot can stop well before the date in its name so slices are bounded by what it held
+            self.catalog = SnapshotCatalog(data_dir=self.data_dir)
+            self.snapshot = self.catalog.get(self.date)
+            self.as_of = self.date if self.snapshot is None else self.catalog.get_last_game(self.snapshot)
+            if self.source_data is not None:
+                self.data = slice_as_of(self.source_data, self.as_of)
+                span["source"] = "source_data"
+            elif self.store is None:
+                self.data = data_cache.read_excel(f"{self.data_dir}/pickup_stats_{date_str}.xlsx", parse_dates=['date'])
+                self.data.dropna(subset=['date'], inplace=True)
+                span["source"] = "workbook"
+            else:
+                self.data = self.store.as_of(self.as_of)
+                span["source"] = "store"
+            # compact types - rows that do not match the schema are dropped with a warning
+            n_rows = len(self.data)
+            self.data = apply_stats_schema(self.data, errors="drop")
+            span["rows"] = len(self.data)
+            span["rows_rejected"] = n_rows - len(self.data)
         self.total_games = int(len(self.data)/4)
         
-        # getting previous data
-        previous_file_date = datetime(2000, 1, 1).date()
-        for file in os.listdir(f"{self.project_dir}/data/"): # looping through all previous files
-            if file[-1] in ["v","x"]: # looking for XSLX or CSV files
-                str_from_file = file.split('_')[(-1)].split('.')[0] 
-                try:
-                    file_date = datetime.strptime(str_from_file, '%m%d%Y').date()
-                    if file_date < self.date:
-                        if file_date > previous_file_date:
-                            previous_file_date = file_date # updating to a later file and looking again
-                        else:
-                            self.previous_date = previous_file_date
-                            previous_date_str = datetime.strftime(previous_file_date, '%m%d%Y')
-                            self.previous_data = pd.read_excel(f"{self.project_dir}/data/pickup_stats_{previous_date_str}.xlsx", parse_dates=['date'])
-                            self.previous_data.dropna(subset=['date'], inplace=True)
-                except ValueError as e:
-                    self.logger.exception(e)
+        # finding the previous snapshot - the data itself is only loaded once it is needed
+        with self.metrics.span("find_previous_report") as span:
+            self.previous_snapshot = self.catalog.latest_before(self.date)
+            if self.previous_snapshot is not None:
+                self.previous_date = datetime.strptime(self.previous_snapshot["date"], '%Y-%m-%d').date()
+            elif self.snapshot is not None:
+                self.previous_date = None # the first snapshot has nothing before it, however the data is read
+            elif self.store is not None:
+                self.previous_date = self.store.previous_session(self.date)
+            elif self.source_data is not None and self.data['date'].nunique() > 1:
+                self.previous_date = self.data.loc[(self.data['date'] < self.data['date'].max()), 'date'].max().date()
+            else:
+                self.previous_date = None
+            # sessions found in the data are already the date of their last game
+            self.previous_as_of = self.previous_date if self.previous_snapshot is None else self.catalog.get_last_game(self.previous_snapshot)
+            span["snapshots"] = len(self.catalog.snapshots)
+        if self.previous_date is None:
+            self.logger.warning(f"No previous report found before {self.date}")
+        self._previous_data = None
+        self.stats_over_time = None
+        self.partnerships = None
+        self.current_form = None
+        self.rating_engine = None
+        self.head_to_head = None
 
         # Players with only a few games
         # --------------------------------------
-        ## Getting the Players
-        n_games_per_player = self.data.groupby('name').count()
-        low_game_players = []
-        for player in n_games_per_player.index:
-            if n_games_per_player.loc[(player, 'win_loss')] < 0.05 * self.total_games: # have to have played in at least 5% of the games
-                low_game_players.append(player)
-        
-        ## Logging the Low-Playing Players
-        self.logger.warning('Removing the following players since they only have one game:')
-        for player in low_game_players:
-            self.logger.warning(f"\t{player}")
+        with self.metrics.span("remove_low_game_players") as span:
+            ## Getting the Players
+            n_games_per_player = self.data.groupby('name', observed=True).count()
+            low_game_players = []
+            for player in n_games_per_player.index:
+                if n_games_per_player.loc[(player, 'win_loss')] < 0.05 * self.total_games: # have to have played in at least 5% of the games
+                    low_game_players.append(player)
+            
+            ## Logging the Low-Playing Players
+            self.logger.warning('Removing the following players since they only have one game:')
+            for player in low_game_players:
+                self.logger.warning(f"\t{player}")
+
+            ## Removing them from both datasets - previous data is filtered once it is loaded
+            self.low_game_players = low_game_players
+            self.all_data = self.data
+            self.data = self.data[(~self.data['name'].isin(low_game_players))]
+            span["players_removed"] = len(low_game_players)
+            span["rows"] = len(self.data)
+
+    @property
+    def previous_data(self):
+        """
+        Raw data from the previous report, sliced from the source data or loaded from the game log store or snapshot catalog on first access
+        """
+        if self._previous_data is None:
+            with self.metrics.span("load_previous_data") as span:
+                if self.previous_date is None:
+                    previous_data = self.data.iloc[:0] # nothing to compare against
+                elif self.source_data is not None:
+                    previous_data = slice_as_of(self.source_data, self.previous_as_of)
+                elif self.store is not None:
+                    previous_data = self.store.as_of(self.previous_as_of)
+                else:
+                    previous_data = data_cache.read_excel(self.catalog.get_path(self.previous_snapshot), parse_dates=['date'])
+                    previous_data.dropna(subset=['date'], inplace=True)
+                # sharing the categories of the current data so the two line up on the same codes
+                previous_data = apply_stats_schema(previous_data, categories=get_categories(self.data), errors="drop")
+                self._previous_data = previous_data[(~previous_data['name'].isin(self.low_game_players))]
+                span["rows"] = len(self._previous_data)
 
-        ## Removing them from both datasets
-        self.data = self.data[(~self.data['name'].isin(low_game_players))]
-        self.previous_data = self.previous_data[(~self.previous_data['name'].isin(low_game_players))]
+        return self._previous_data
 
     def calculate_win_rate(self, player, latest=True):
         """
@@ -103,15 +213,15 @@ class Report:
         """
         # data version control
         if latest:
-            data = self.data.copy()
+            data = self.data
         else:
-            data = self.previous_data.copy()
+            data = self.previous_data
 
         player = player.title()
         player_data = data[(data['name'] == player)]
         n_games = len(player_data)
         if n_games > 0:
-            win_rate = len(player_data[(player_data['win_loss'] == 'win')]) / n_games * 100
+            win_rate = get_wins(player_data).sum() / n_games * 100
         else:
             win_rate = 0
 
@@ -134,9 +244,9 @@ class Report:
             player's ace:error ratio
         """
         if latest:
-            data = self.data.copy()
+            data = self.data
         else:
-            data = self.previous_data.copy()
+            data = self.previous_data
         player = player.title()
         player_data = data[(data['name'] == player)]
         games_with_aces = player_data[(player_data['aces'] > 0)]
@@ -164,9 +274,9 @@ class Report:
             player's average point differential
         """
         if latest:
-            data = self.data.copy()
+            data = self.data
         else:
-            data = self.previous_data.copy()
+            data = self.previous_data
 
         player = player.title()
         player_data = data[(data['name'] == player)]
@@ -176,42 +286,162 @@ class Report:
         """
         Calculates stats per game
 
+        Parameters
+        ----------
+        latest : boolean, default True
+            whether to use the latest data or the previous data
+        decimals : int, default 1
+            number of decimals to round the stats to
+
         Returns
         -------
         stats_per_game : DataFrame
             average stats per participant
         """
         if latest:
-            data = self.data.copy()
+            data = self.data
         else:
-            data = self.previous_data.copy()
-
-        per_game = {col: [] for col in data.columns if col not in ['date', 'partner','win_loss', 'match_id','tournament',"switch1","switch2","switch3","switch4","switch5","switch6","switch7","switch8"]}
-        for calculated_stat in ('n','win_rate', 'ace2error',"point_differential"):
-            per_game[calculated_stat] = []
-
-        for player in data['name'].unique():
-            player_data = data[(data['name'] == player)]
-            for key in per_game.keys():
-                if key == 'name':
-                    per_game[key].append(player)
-                elif key == 'win_rate':
-                    win_rate, _ = self.calculate_win_rate(player, latest=latest)
-                    per_game['win_rate'].append(round(win_rate, decimals))
-                elif key == 'ace2error':
-                    ace2error = self.calculate_ace_error_ratio(player, latest=latest)
-                    per_game['ace2error'].append(round(ace2error, decimals))
-                elif key == "point_differential":
-                    point_diff = self.calculate_point_differential(player, latest=latest)
-                    per_game["point_differential"].append(round(point_diff, decimals))
-                elif key == 'n':
-                    per_game['n'].append(len(player_data))
-                elif key in ("hitting_efficiency", "serving_percentage", "blocking_efficiency"):
-                    per_game[key].append(round(np.nanmean(player_data[key]) * 100, decimals))
-                else:
-                    per_game[key].append(round(np.nanmean(player_data[key]), decimals))
-                    
-        return pd.DataFrame(per_game)
+            data = self.previous_data
+
+        # the same slice is often needed more than once - e.g. a batch report's previous data is the report before's data
+        key = (self.as_of if latest else self.previous_as_of, tuple(sorted(self.low_game_players)), decimals)
+        if key not in self.stats_cache:
+            # players whose games are the same in both snapshots are only calculated once
+            self.stats_cache[key] = self.stats_memo.get_stats(data, decimals=decimals)
+
+        return self.stats_cache[key].copy()
+
+    def get_partnership_stats(self):
+        """
+        Gets the record of every partnership, calculating it on first use
+
+        Returns
+        -------
+        partnerships : DataFrame
+            games, wins, win rate, and point differential indexed by team
+        """
+        if self.partnerships is None:
+            self.partnerships = calculate_partnership_stats(self.data)
+
+        return self.partnerships
+
+    def update_checkpoint(self, checkpoint, new_checkpoint, state_path):
+        """
+        Brings a FormTracker or RatingEngine loaded from its state file up to date with this report's games
+
+        A checkpoint holding matches this report does not have, e.g. from a snapshot taken after the
+        report's last game, is rebuilt from this report's games. It is only saved back when it is not
+        ahead of the report so building an older report never overwrites the latest state.
+
+        Parameters
+        ----------
+        checkpoint : FormTracker or RatingEngine
+            loaded from state_path
+        new_checkpoint : callable
+            makes an empty checkpoint with the same parameters
+        state_path : str
+            file the checkpoint is saved to
+
+        Returns
+        -------
+        <checkpoint> : FormTracker or RatingEngine
+            holding every match of the report's data and nothing else
+        """
+        ahead = checkpoint.last_date is not None and checkpoint.last_date > self.as_of
+        if not checkpoint.match_ids <= set(self.all_data['match_id'].astype(str).unique()):
+            checkpoint = new_checkpoint()
+        if checkpoint.update(self.all_data) > 0 and not ahead:
+            checkpoint.save(state_path)
+
+        return checkpoint
+
+    def get_current_form(self, window=FORM_WINDOW):
+        """
+        Gets every player's current form, only adding the games played since the form was last saved
+
+        Parameters
+        ----------
+        window : int, default 10
+            number of games in the last-N average - players with fewer games are left out
+
+        Returns
+        -------
+        current_form : DataFrame
+            last-N and exponentially weighted averages indexed by name
+        """
+        if self.current_form is None:
+            state_path = f"{self.data_dir}/{FORM_STATE_FILE}"
+            tracker = self.update_checkpoint(FormTracker.load(state_path, window=window), lambda: FormTracker(window=window), state_path)
+
+            form = tracker.get_form(min_games=window)
+            self.current_form = form[(~form.index.isin(self.low_game_players))]
+
+        return self.current_form
+
+    def get_rating_engine(self):
+        """
+        Gets the doubles ratings, only rating the matches played since the ratings were last checkpointed
+
+        Returns
+        -------
+        rating_engine : RatingEngine
+            ratings using every match up to and including the report date
+        """
+        if self.rating_engine is None:
+            state_path = f"{self.data_dir}/{RATING_STATE_FILE}"
+            self.rating_engine = self.update_checkpoint(RatingEngine.load(state_path), RatingEngine, state_path)
+
+        return self.rating_engine
+
+    def get_top_rated(self, n_top_players=5):
+        """
+        Gets the highest rated players
+
+        Parameters
+        ----------
+        n_top_players : int, default 5
+            number of players to include
+
+        Returns
+        -------
+        <res> : dict
+            players mapped to their rating, change in rating since the previous report, and number of games
+        """
+        ratings = self.get_rating_engine().get_ratings(since=self.previous_as_of)
+        ratings = ratings[(~ratings.index.isin(self.low_game_players))].head(n_top_players)
+        return {player: (int(row['rating']), f"{int(row['change']):+d}" if 'change' in row else "", int(row['games'])) for player, row in ratings.iterrows()}
+
+    def get_head_to_head(self):
+        """
+        Gets the partner and opponent matrices, building them on first use
+        """
+        if self.head_to_head is None:
+            self.head_to_head = HeadToHead(self.all_data)
+
+        return self.head_to_head
+
+    def get_rivalries(self, min_games=5, top_rivalries=5):
+        """
+        Gets the pairs of players that have played against each other the most
+
+        Parameters
+        ----------
+        min_games : int, default 5
+            minimum number of games against each other required to include the pair
+        top_rivalries : int, default 5
+            maximum number of pairs to include
+
+        Returns
+        -------
+        <res> : dict
+            "<player> vs <opponent>" mapped to each player's wins and the number of games
+        """
+        matchups = self.get_head_to_head().get_matchups(min_games=min_games, exclude=self.low_game_players)
+        res = {}
+        for _, row in matchups.head(top_rivalries).iterrows():
+            res[f"{row['player']} vs {row['opponent']}"] = (int(row['player_wins']), int(row['opponent_wins']), int(row['games']))
+
+        return res
 
     def get_winningest_team(self, min_games=5, top_teams=5):
         """
@@ -219,34 +449,21 @@ class Report:
 
         Parameters
         ----------
-        min_games : int, default 2
+        min_games : int, default 5
             minimum number of games required to include team as possibility
         top_teams : int, default 5
-            maximum number of teams to include
+            maximum number of teams to include - fewer are returned if fewer teams qualify
 
         Return
         ------
         <res> : dict
-            teams, their win percentage, and the number of games won
+            teams, their win percentage, and the number of games played
         """
-        teams = []
-        for i in range(len(self.data)):
-            partners = sorted(self.data.iloc[i][['name', 'partner']].values)
-            teams.append(f"{partners[0]}/{partners[1]}")
-        else:
-            data = self.data.copy()
-            data['team'] = teams
-            data['win'] = [1 if val == 'win' else 0 for val in data['win_loss']]
-            grouped = data[['team', 'win']].groupby('team').mean()
-            grouped['n'] = data.groupby('team').count()['win'] / 2
-            grouped = grouped[(grouped['n'] >= min_games)]
-            grouped.sort_values(['win', 'n'], ascending=False, inplace=True)
-            res = {}
-            for i in range(top_teams):
-                res[grouped.index[i]] = (
-                 f"{round(grouped.iloc[i]['win'] * 100, 1)}%", int(grouped.iloc[i]['n']))
-            else:
-                return res
+        res = {}
+        for team, row in get_top_partnerships(self.get_partnership_stats(), top_teams=top_teams, min_games=min_games).iterrows():
+            res[team] = (f"{round(row['win_rate'] * 100, 1)}%", int(row['games']))
+
+        return res
 
     def get_simplified_results_per_player(self, latest=True):
         """
@@ -298,141 +515,329 @@ class Report:
         changes = latest_stats - previous_stats
         return changes.round(decimals=2)
 
+    def get_stats_over_time(self):
+        """
+        Gets every player's running stats, calculating them on first use
+
+        Returns
+        -------
+        stats_over_time : DataFrame
+            running win rate, running means, and rating indexed by name and date
+        """
+        if self.stats_over_time is None:
+            stats_over_time = calculate_cumulative_stats(self.data, [variable for variable in PLOT_VARIABLES if variable != 'rating'])
+            self.stats_over_time = stats_over_time.join(self.get_rating_engine().get_rating_history())
+
+        return self.stats_over_time
+
     def plot_stats_over_time(self, player):
         """
         Plots the players stats over time
         """
-        data_player = self.data[(self.data['name'] == player)]
-        data_player['date'] = pd.to_datetime(data_player['date'])
-        data_player.sort_values(['date'], inplace=True)
-        _, axes = plt.subplots(3, 2, figsize=(10, 12), sharex=True)
-        variables = ['win_rate', 'hitting_efficiency', 'effectiveness', 'serving_percentage', 'serve_receive_rating', 'errors']
-        limits = [[0, 100], [0, 1], [0, 10], [0.5, 1], [0, 3], [0, 7]]
-        for variable, limit, ax in zip(variables, limits, axes.flat):
-            variable_points = []
-
-            for d in data_player['date'].unique():
-                data_player_to_date = data_player[(data_player['date'] <= d)]
-                if variable == 'win_rate':
-                    n_games = len(data_player_to_date)
-                    win_rate = round(len(data_player_to_date[(data_player_to_date['win_loss'] == 'win')]) / n_games * 100, 1)
-                    variable_points.append(win_rate)
-                else:
-                    variable_points.append(np.mean(data_player_to_date[variable]))
-
-            ax.plot((data_player['date'].unique()), variable_points, lw=3, color='black')
-            ax.xaxis.set_major_locator(mdates.MonthLocator())
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
-            ax.xaxis.set_minor_locator(mdates.DayLocator(interval=7))
-            ax.xaxis.set_minor_formatter(mdates.DateFormatter('%d'))
-            ax.set_ylim(limit)
-            ax.tick_params(axis='x', labelsize=12)
-            ax.tick_params(axis='x', which="major",labelsize=14,pad=10)
-            ax.tick_params(axis='y', labelsize=14)
-            ax.set_title((variable.replace('_', ' ').title()), fontsize=18)
-            
-            for loc in ('top', 'right'):
-                ax.spines[loc].set_visible(False)
-
-        plt.savefig(f"{self.project_dir}/figures/{player}-stats_over_time.png")
-        plt.close()
+        _, error = render_player_figure(player, self.get_stats_over_time().loc[player], self.get_player_figure(player))
+        if error is not None:
+            self.logger.error(f"Unable to render figure for {player}: {error}")
 
     def get_player_figure(self, player):
         """
-        Gets the string corresponding to the player's statistics
+        Gets the path to the player's figure - rendered by run() or reused from the figure cache
         """
-        return f"{self.project_dir}/figures/{player}-stats_over_time.png"
+        return f"{self.output_dir}/figures/{player}-stats_over_time.png"
 
-    def run(self, n_top_players=5):
+    def get_template_context(self, results, n_top_players=5):
+        """
+        Gets every value the report template needs
+
+        Parameters
+        ----------
+        results : dict
+            leaderboards from build_leaderboards
+        n_top_players : int, default 5
+            number of teams to include in the top teams
+
+        Returns
+        -------
+        context : dict
+            template variables
+        """
+        per_player = self.get_simplified_results_per_player()
+        return dict(date=self.date, previous_date=self.previous_date, n_games=self.total_games,
+            **get_template_leaderboards(results),
+            top_teams=self.get_winningest_team(top_teams=n_top_players),
+            rivalries=self.get_rivalries(top_rivalries=n_top_players),
+            top_rated=self.get_top_rated(n_top_players=n_top_players),
+            form=get_form_leaderboards(self.get_current_form(), n_top_players=n_top_players),
+            form_window=FORM_WINDOW, form_percent=FORM_PERCENT_VARIABLES,
+            per_player=per_player,
+            player_figures={player: self.get_player_figure(player) for player in per_player})
+
+    def get_metrics_path(self):
+        """
+        Gets the path to the stage metrics saved next to the report
+        """
+        return f"{self.output_dir}/reports/hlb_report-{self.date}.metrics.json"
+
+    def run(self, n_top_players=5, n_workers=1, pdf="now", pdf_converter=None, figures=True, render=True):
         """
         Gets the statistics and generates the final report
 
+        The time, row count, and peak memory of each stage are saved to get_metrics_path() even
+        if a stage fails.
+
         Parameters
         ----------
         n_top_players : int, default 5
             number of players to include on the leaderboard
+        n_workers : int, default 1
+            number of processes used to render the player figures
+        pdf : str, default "now"
+            "now" converts the report to PDF, "later" adds it to the PDF queue, and "none" only creates the HTML
+        pdf_converter : PdfConverter, default None
+            converter to submit the PDF conversion to without waiting on it. If None, the
+            conversion runs on a converter that is waited on before returning
+        figures : boolean, default True
+            whether to render the player figures
+        render : boolean, default True
+            whether to create the report - if False, the run stops once the stats and leaderboards are calculated
+
+        Returns
+        -------
+        <future> : concurrent.futures.Future or None
+            pending conversion when a pdf_converter is given
+        """
+        try:
+            return self._run(n_top_players=n_top_players, n_workers=n_workers, pdf=pdf, pdf_converter=pdf_converter, figures=figures, render=render)
+        finally:
+            if self.stats_memo.path is not None:
+                self.stats_memo.save()
+            self.metrics.save(self.get_metrics_path())
+            self.logger.info(f"Stage metrics available at {self.get_metrics_path()}")
+
+    def _run(self, n_top_players=5, n_workers=1, pdf="now", pdf_converter=None, figures=True, render=True):
+        """
+        Runs each stage of run() within a timing span
         """
         self.logger.info("Calculating per game statistics")
-        stats_per_game = self.calculate_per_game_stats(latest=True)
+        with self.metrics.span("per_game_stats") as span:
+            # the memo may be shared between reports so only its misses during this stage are counted
+            misses = self.stats_memo.misses
+            stats_per_game = self.calculate_per_game_stats(latest=True)
+            span["players"] = len(stats_per_game)
+            span["players_calculated"] = self.stats_memo.misses - misses
 
         self.logger.info("Getting leaderboard stats")
-        results = {}
-        top_results = {}
-        bottom_results = {}
-        mip_results = {}
-        changes = self.compare_stats()
-        for variable in stats_per_game.columns:
-            if variable not in ('name', ):
-                var_results = {}
-                top_results = {}
-                bottom_results = {}
-                mip_results = {}
-                if variable in ('errors', ):
-                    ascend = True
-                else:
-                    ascend = False
-                # top results
-                top_results_per_variable = stats_per_game.sort_values(variable, ascending=ascend)[:n_top_players]
-                for player, value in zip(top_results_per_variable['name'].values, top_results_per_variable[variable].values):
-                    top_results[player] = value
-
-                var_results["top"] = top_results
-                
-                # bottom results
-                bot_results_per_variable = stats_per_game.sort_values(variable, ascending=not ascend)[:n_top_players]
-                for player, value in zip(bot_results_per_variable['name'].values, bot_results_per_variable[variable].values):
-                    bottom_results[player] = value
-                
-                var_results["bottom"] = bottom_results
-
-                # mip results
-                mip_results_per_variable = changes.sort_values(variable, ascending=ascend)[:n_top_players]
-                for player, value in zip(mip_results_per_variable.index.values, mip_results_per_variable[variable].values):
-                    mip_results[player] = value
-
-                var_results["mip"] = mip_results
-
-                results[variable] = var_results
-
-        self.results = results
-
-        for player in stats_per_game['name'].unique():
-            self.plot_stats_over_time(player)
-
-        templateLoader = jinja2.FileSystemLoader(searchpath=f'{self.project_dir}/templates/')
-        templateEnv = jinja2.Environment(loader=templateLoader)
-        func_dict = {'compare_stat':self.compare_stats, 
-            'get_player_figure':self.get_player_figure}
-        TEMPLATE_FILE = 'stat_update_template.html'
-        template = templateEnv.get_template(TEMPLATE_FILE)
-        template.globals.update(func_dict)
-        outputText = template.render(date=self.date, previous_date=self.previous_date, n_games=self.total_games,
-            win_rate=results['win_rate'],
-            effectiveness=results['effectiveness'],
-            point_diff=results["point_differential"],
-            kills=results['kills'],
-            efficiency=results['hitting_efficiency'],
-            aces=results['aces'],
-            serving=results['serving_percentage'],
-            blocks=results['blocks'],
-            block_eff=results["blocking_efficiency"],
-            errors=results['errors'],
-            pass_rating=results['serve_receive_rating'],
-            ace2error=results['ace2error'],
-            top_teams=self.get_winningest_team(top_teams=n_top_players),
-            per_player=self.get_simplified_results_per_player())
-        html_file = open(f"{self.project_dir}/reports/hlb_report-{self.date}.html", 'w')
-        html_file.write(outputText)
-        html_file.close()
-        pdfkit.from_file(f"{self.project_dir}/reports/hlb_report-{self.date}.html", f"{self.project_dir}/reports/hlb_report-{self.date}.pdf")
+        with self.metrics.span("leaderboards") as span:
+            results = build_leaderboards(stats_per_game, self.compare_stats(), n_top_players=n_top_players)
+            self.results = results
+            span["metrics"] = len(results)
+
+        if not render:
+            return None
+
+        if figures:
+            self.logger.info("Rendering player figures")
+            with self.metrics.span("figures") as span:
+                failed_figures = render_figures(self.get_stats_over_time(), stats_per_game['name'].unique(), f"{self.output_dir}/figures", n_workers=n_workers)
+                if failed_figures:
+                    self.logger.warning(f"{len(failed_figures)} player figures could not be rendered")
+                span["players"] = stats_per_game['name'].nunique()
+                span["failed"] = len(failed_figures)
+
+        self.logger.info("Rendering report")
+        html_path = f"{self.output_dir}/reports/hlb_report-{self.date}.html"
+        with self.metrics.span("ratings") as span:
+            span["matches"] = len(self.get_rating_engine().match_ids)
+        with self.metrics.span("head_to_head") as span:
+            span["players"] = len(self.get_head_to_head().players)
+        with self.metrics.span("current_form") as span:
+            span["players"] = len(self.get_current_form())
+        with self.metrics.span("template_context"):
+            context = self.get_template_context(results, n_top_players=n_top_players)
+        with self.metrics.span("render_html") as span:
+            render_report(f'{self.project_dir}/templates', 'stat_update_template.html', html_path,
+                context, cache_dir=f"{self.data_dir}/.cache/templates")
+            span["bytes"] = os.path.getsize(html_path)
+        self.logger.info(f"HTML report available at {html_path}")
+
+        pdf_path = f"{self.output_dir}/reports/hlb_report-{self.date}.pdf"
+        if pdf == "later":
+            with self.metrics.span("pdf") as span:
+                queue_conversion(html_path, pdf_path, reports_dir=f"{self.output_dir}/reports")
+                span["status"] = "queued"
+            self.logger.info("Queued PDF conversion - run src/pdf_pipeline.py to convert")
+        elif pdf == "now":
+            with self.metrics.span("pdf") as span:
+                if pdf_converter is not None:
+                    span["status"] = "submitted" # converted in the background after the metrics are saved
+                    return pdf_converter.submit(html_path, pdf_path)
+                with PdfConverter(max_workers=1, reports_dir=f"{self.output_dir}/reports") as converter:
+                    span["status"] = converter.submit(html_path, pdf_path).result()
+
+def load_source_data(use_store=False, data_dir=None):
+    """
+    Loads every game once so that reports for several dates can be sliced from it
+
+    Parameters
+    ----------
+    use_store : boolean, default False
+        whether to read the games from the game log store rather than the latest dated workbook
+    data_dir : str, default None
+        directory holding the workbooks. If None, the project's data/ directory is used
+
+    Returns
+    -------
+    <data> : DataFrame
+        raw data covering every available date
+    """
+    if data_dir is None:
+        data_dir = f"{pathlib.Path(__file__).resolve().parent.parent}/data"
+    if use_store:
+        store = GameLog(f"{data_dir}/game_log.sqlite")
+        data = store.games()
+        store.close()
+        return apply_stats_schema(data, errors="drop")
+
+    catalog = SnapshotCatalog(data_dir=data_dir)
+    if not catalog.snapshots:
+        raise FileNotFoundError(f"No pickup_stats snapshots in {data_dir}")
+    # snapshots only ever add games so the latest one covers every earlier date
+    data = data_cache.read_excel(catalog.get_path(catalog.snapshots[-1]), parse_dates=['date'])
+    return apply_stats_schema(data.dropna(subset=['date']), errors="drop")
+
+def run_batch(dates, n_top_players=5, n_workers=1, pdf="now", use_store=False, figures=True, render=True, data_dir=None, output_dir=None, stats_memo=None, source_data=None):
+    """
+    Generates the reports for several dates from a single load of the data
+
+    Parameters
+    ----------
+    dates : list of str
+        report dates in form "%m%d%Y"
+    n_top_players : int, default 5
+        number of players to include on the leaderboard
+    n_workers : int, default 1
+        number of processes used to render the player figures and PDFs
+    pdf : str, default "now"
+        "now" converts the reports to PDF, "later" adds them to the PDF queue, and "none" only creates the HTML
+    use_store : boolean, default False
+        whether to read the games from the game log store rather than the latest dated workbook
+    figures : boolean, default True
+        whether to render the player figures
+    render : boolean, default True
+        whether to create the reports - if False, each run stops once the stats and leaderboards are calculated
+    data_dir : str, default None
+        directory holding the workbooks. If None, the project's data/ directory is used
+    output_dir : str, default None
+        directory holding the figures/ and reports/ directories. If None, the project directory is used
+    stats_memo : PlayerStatsMemo, default None
+        per player stats shared by every report. If None, a memo that only lives for the batch is used
+    source_data : DataFrame, default None
+        output of load_source_data if it was already loaded e.g. to list the session dates. If None, it is loaded here
+
+    Returns
+    -------
+    timings : dict
+        seconds spent on each report date
+    failures : dict
+        report date mapped to the error from its PDF conversion - empty if every conversion succeeded
+    """
+    if source_data is None:
+        source_data = load_source_data(use_store=use_store, data_dir=data_dir)
+    stats_cache = {}
+    stats_memo = PlayerStatsMemo() if stats_memo is None else stats_memo
+    timings = {}
+    html_reports = []
+    # figures are not dated so they only need to be drawn for the final report
+    dates = sorted(dates, key=lambda date_str: datetime.strptime(date_str, '%m%d%Y'))
+    for i, date_str in enumerate(dates):
+        start = time.perf_counter()
+        report = Report(date_str, source_data=source_data, stats_cache=stats_cache, stats_memo=stats_memo, data_dir=data_dir, output_dir=output_dir)
+        report.run(n_top_players, n_workers=n_workers, pdf="later" if pdf == "later" else "none", figures=figures and i == len(dates) - 1, render=render)
+        html_reports.append(f"{report.output_dir}/reports/hlb_report-{report.date}")
+        timings[date_str] = time.perf_counter() - start
+
+    # converting once every figure is in place
+    failures = {}
+    if pdf == "now" and render:
+        with PdfConverter(max_workers=n_workers, reports_dir=f"{report.output_dir}/reports") as converter:
+            futures = {date_str: converter.submit(f"{report_path}.html", f"{report_path}.pdf") for date_str, report_path in zip(dates, html_reports)}
+            for date_str, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    report.logger.error(f"Unable to convert the {date_str} report: {e}")
+                    failures[date_str] = f"{type(e).__name__}: {e}"
+
+    return timings, failures
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', help='date of report - should be string in format %m%d%Y', default='04272022',type=str)    
     parser.add_argument('-n', help='number players to use in leaderboard.', default=5, type=int) 
+    parser.add_argument('--dates', help='dates of several reports to generate from one load of the data - strings in format %m%d%Y', nargs='+', type=str)
+    parser.add_argument('--from', dest='from_date', help='generate a report for every session on or after this date - string in format %m%d%Y', type=str)
+    parser.add_argument('--to', dest='to_date', help='generate a report for every session on or before this date - string in format %m%d%Y', type=str)
+    parser.add_argument('-w', help='number of processes used to render the player figures', default=1, type=int)
+    pdf_mode = parser.add_mutually_exclusive_group()
+    pdf_mode.add_argument('--html-only', '--no-pdf', dest='html_only', help='only create the HTML report', action='store_true')
+    pdf_mode.add_argument('--pdf-later', help='queue the PDF conversion for src/pdf_pipeline.py instead of waiting on it', action='store_true')
+    pdf_mode.add_argument('--stats-only', help='only calculate the stats and leaderboards - nothing is plotted or rendered', action='store_true')
+    parser.add_argument('--no-figures', help='skip rendering the player figures - the report uses whichever figures already exist', action='store_true')
+    parser.add_argument('--store', help='read games from the game log store instead of the dated workbooks', action='store_true')
+    parser.add_argument('--data-dir', help='directory holding the workbooks - defaults to data/', default=None, type=str)
+    parser.add_argument('--output-dir', help='directory holding the figures/ and reports/ directories - defaults to the project directory', default=None, type=str)
+    parser.add_argument('--memo', help='keep the per player stats in data/.cache so later runs only calculate players with new games', action='store_true')
+    parser.add_argument('--profile', help='save a cProfile dump of the whole run to reports/ - view it with `python -m pstats <file>`', action='store_true')
     args = parser.parse_args()
 
-    # Generating the Report
-    # ---------------------
-    report = Report(args.d)
-    report.run(args.n)
\ No newline at end of file
+    if args.html_only or args.stats_only:
+        pdf = "none"
+    elif args.pdf_later:
+        pdf = "later"
+    else:
+        pdf = "now"
+
+    data_dir = args.data_dir if args.data_dir is not None else f"{pathlib.Path(__file__).resolve().parent.parent}/data"
+    stats_memo = PlayerStatsMemo(path=f"{data_dir}/.cache/{MEMO_FILE}") if args.memo else None
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if args.dates or args.from_date or args.to_date:
+            # Generating a Batch of Reports
+            # -----------------------------
+            dates = args.dates
+            # loaded once here so the session dates can be listed from the same data the reports use
+            source_data = load_source_data(use_store=args.store, data_dir=args.data_dir)
+            if dates is None:
+                session_dates = source_data['date'].dt.date.unique()
+                from_date = datetime.strptime(args.from_date, '%m%d%Y').date() if args.from_date else min(session_dates)
+                to_date = datetime.strptime(args.to_date, '%m%d%Y').date() if args.to_date else max(session_dates)
+                dates = [datetime.strftime(d, '%m%d%Y') for d in sorted(session_dates) if from_date <= d <= to_date]
+
+            timings, failures = run_batch(dates, args.n, n_workers=args.w, pdf=pdf, use_store=args.store, figures=not args.no_figures,
+                render=not args.stats_only, data_dir=args.data_dir, output_dir=args.output_dir, stats_memo=stats_memo, source_data=source_data)
+            print("Report\tSeconds\tPDF")
+            for date_str, seconds in timings.items():
+                status = failures.get(date_str, "ok").splitlines()[0] if pdf == "now" else "none"
+                print(f"{date_str}\t{seconds:.2f}\t{status}")
+            print(f"Total\t{sum(timings.values()):.2f}")
+            if failures:
+                raise SystemExit(f"{len(failures)} of {len(timings)} PDF conversions failed")
+        else:
+            # Generating the Report
+            # ---------------------
+            report = Report(args.d, use_store=args.store, stats_memo=stats_memo, data_dir=args.data_dir, output_dir=args.output_dir)
+            report.run(args.n, n_workers=args.w, pdf=pdf, figures=not args.no_figures, render=not args.stats_only)
+            if args.stats_only:
+                print(report.calculate_per_game_stats().to_string(index=False))
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            output_dir = args.output_dir if args.output_dir is not None else f"{pathlib.Path(__file__).resolve().parent.parent}"
+            if args.dates or args.from_date or args.to_date:
+                profile_path = f"{output_dir}/reports/hlb_batch-{datetime.now():%Y%m%d%H%M%S}.prof"
+            else:
+                profile_path = f"{output_dir}/reports/hlb_report-{datetime.strptime(args.d, '%m%d%Y').date()}.prof"
+            profiler.dump_stats(profile_path)
+            print(f"Profile saved to {profile_path}")
@@ -0,0 +1,144 @@
+import sys
+import pathlib
+
+import pandas as pd, numpy as np
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.head_to_head
+from stats_engine import get_match_rows
+
+def _count_pairs(first, second, n):
+    """
+    Counts every (first, second) pair of player codes into an n x n matrix
+    """
+    return np.bincount(first * n + second, minlength=n * n).reshape(n, n)
+
+class HeadToHead:
+
+    def __init__(self, data) -> None:
+        """
+        Every player's record with and against every other player, built in a single vectorized pass over the matches
+
+        Parameters
+        ----------
+        data : DataFrame
+            game rows with the schema applied - four rows per match
+
+        Creates
+        -------
+        players : Index
+            player names - a player's position is their code in the matrices
+        games_together : ndarray
+            number of games each pair of players played as partners
+        wins_together : ndarray
+            number of games each pair of players won as partners
+        games_against : ndarray
+            number of games each pair of players played on opposite teams
+        wins_against : ndarray
+            number of games the row player beat the column player
+        games : ndarray
+            number of games each player played
+        wins : ndarray
+            number of games each player won
+        """
+        names = data['name'] if isinstance(data['name'].dtype, pd.CategoricalDtype) else data['name'].astype('category')
+        self.players = pd.Index(names.cat.categories.astype(str))
+        n = len(self.players)
+
+        codes = names.cat.codes.values.astype(np.int64)[get_match_rows(data)]
+        winners, losers = codes[:, :2], codes[:, 2:]
+
+        wins_together = _count_pairs(winners[:, 0], winners[:, 1], n)
+        losses_together = _count_pairs(losers[:, 0], losers[:, 1], n)
+        # partnerships are recorded in both directions
+        self.wins_together = wins_together + wins_together.T
+        self.games_together = self.wins_together + losses_together + losses_together.T
+
+        # every winner beat both losers
+        self.wins_against = sum(_count_pairs(winners[:, i], losers[:, j], n) for i in range(2) for j in range(2))
+        self.games_against = self.wins_against + self.wins_against.T
+
+        self.wins = np.bincount(winners.ravel(), minlength=n)
+        self.games = self.wins + np.bincount(losers.ravel(), minlength=n)
+
+    def get_code(self, player):
+        """
+        Gets the player's position in the matrices
+        """
+        code = self.players.get_indexer([player])[0]
+        if code < 0:
+            raise KeyError(f"{player} has not played any games")
+        return code
+
+    def get_record_against(self, player, opponent):
+        """
+        Gets the player's record against an opponent
+
+        Returns
+        -------
+        <record> : dict
+            number of games, wins, and win rate - the win rate is NaN if they have never played each other
+        """
+        i, j = self.get_code(player), self.get_code(opponent)
+        games, wins = int(self.games_against[i, j]), int(self.wins_against[i, j])
+        return {"games": games, "wins": wins, "win_rate": wins / games if games else float("nan")}
+
+    def get_record_with(self, player, partner):
+        """
+        Gets the player's record with and without a partner
+
+        Returns
+        -------
+        <record> : dict
+            "with" and "without" dictionaries holding the number of games, wins, and win rate
+        """
+        i, j = self.get_code(player), self.get_code(partner)
+        record = {}
+        for key, games, wins in (("with", self.games_together[i, j], self.wins_together[i, j]),
+                                 ("without", self.games[i] - self.games_together[i, j], self.wins[i] - self.wins_together[i, j])):
+            record[key] = {"games": int(games), "wins": int(wins), "win_rate": float(wins / games) if games else float("nan")}
+
+        return record
+
+    def get_matchups(self, min_games=1, exclude=()):
+        """
+        Gets the record of every pair of players that have played against each other
+
+        Parameters
+        ----------
+        min_games : int, default 1
+            pairs with fewer games against each other are left out
+        exclude : list of str, default ()
+            players to leave out
+
+        Returns
+        -------
+        <matchups> : DataFrame
+            one row per pair with the player, opponent, games, and the wins of each - each pair is listed
+            once with the names in alphabetical order, sorted from most games
+        """
+        included = ~self.players.isin(exclude)
+        # upper triangle so each pair is only listed once
+        i, j = np.triu_indices(len(self.players), k=1)
+        keep = (self.games_against[i, j] >= max(min_games, 1)) & included[i] & included[j]
+        i, j = i[keep], j[keep]
+        matchups = pd.DataFrame({
+            'player': self.players[i],
+            'opponent': self.players[j],
+            'games': self.games_against[i, j],
+            'player_wins': self.wins_against[i, j],
+            'opponent_wins': self.wins_against[j, i],
+        })
+        return matchups.sort_values(['games', 'player', 'opponent'], ascending=[False, True, True], ignore_index=True)
+
+    def get_win_rates_against(self, min_games=1):
+        """
+        Gets every player's win rate against every opponent
+
+        Returns
+        -------
+        <win_rates> : DataFrame
+            player by opponent - NaN where they have played each other fewer than min_games times
+        """
+        games = self.games_against.astype(float)
+        games[(games < max(min_games, 1))] = np.nan
+        return pd.DataFrame(self.wins_against / games, index=self.players, columns=self.players)
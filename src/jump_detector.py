@@ -0,0 +1,328 @@
+import os, sys
+import argparse
+import logging
+import pathlib
+
+from collections import Counter, namedtuple
+from datetime import datetime
+
+import pandas as pd, numpy as np
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.jump_detector
+import fitbit_data
+
+logger = logging.getLogger(__name__)
+
+# smallest climb in a single sample that counts towards a jump - Fitbit reports the climb in each interval
+JUMP_THRESHOLD = 1
+# active samples further apart than this are separate jumps
+MIN_GAP_SECONDS = 3
+# samples handed to the detector at once when a series is already in memory
+CHUNK_SIZE = 3600
+# matches without plays recorded late enough to show otherwise are assumed to last this long
+MATCH_MINUTES = 20
+BREAK_MINUTES = 3
+
+JumpEvent = namedtuple("JumpEvent", ["start", "end", "climb"])
+
+class JumpDetector:
+
+    def __init__(self, threshold=JUMP_THRESHOLD, min_gap_seconds=MIN_GAP_SECONDS) -> None:
+        """
+        Finds jumps in a stream of intraday climb samples, only keeping the jump in progress between chunks
+
+        Parameters
+        ----------
+        threshold : float, default JUMP_THRESHOLD
+            smallest climb in a single sample that counts towards a jump
+        min_gap_seconds : int, default MIN_GAP_SECONDS
+            active samples further apart than this are separate jumps
+
+        Creates
+        -------
+        current : JumpEvent
+            jump that may continue into the next chunk or None
+        """
+        self.threshold = threshold
+        self.min_gap = np.timedelta64(min_gap_seconds, 's')
+        self.current = None
+
+    def process(self, chunk):
+        """
+        Adds the next chunk of samples
+
+        Parameters
+        ----------
+        chunk : Series
+            climb in each sample indexed by timestamp - chunks must arrive in time order
+
+        Returns
+        -------
+        <events> : list of JumpEvent
+            jumps that ended within the chunk
+        """
+        times = chunk.index.values
+        values = chunk.values.astype(float)
+        active = np.flatnonzero(values >= self.threshold)
+        events = []
+        if len(active) > 0:
+            times, values = times[active], values[active]
+            # a new jump starts wherever the previous active sample is too far back
+            starts = np.flatnonzero(np.r_[True, np.diff(times) > self.min_gap])
+            ends = np.r_[starts[1:], len(times)] - 1
+            climbs = np.add.reduceat(values, starts)
+            jumps = [JumpEvent(times[start], times[end], climb) for start, end, climb in zip(starts, ends, climbs)]
+
+            if self.current is not None:
+                if jumps[0].start - self.current.end <= self.min_gap: # the jump in progress carries on
+                    jumps[0] = JumpEvent(self.current.start, jumps[0].end, self.current.climb + jumps[0].climb)
+                else:
+                    events.append(self.current)
+
+            events += jumps[:-1]
+            self.current = jumps[-1]
+
+        if self.current is not None and len(chunk) > 0 and chunk.index.values[-1] - self.current.end > self.min_gap:
+            events.append(self.current)
+            self.current = None
+
+        return [JumpEvent(pd.Timestamp(event.start), pd.Timestamp(event.end), float(event.climb)) for event in events]
+
+    def flush(self):
+        """
+        Ends the stream, returning the jump in progress if there is one
+        """
+        events = [] if self.current is None else [JumpEvent(pd.Timestamp(self.current.start), pd.Timestamp(self.current.end), float(self.current.climb))]
+        self.current = None
+        return events
+
+    def detect(self, chunks):
+        """
+        Yields every jump in a stream of chunks as soon as it ends
+        """
+        for chunk in chunks:
+            yield from self.process(chunk)
+
+        yield from self.flush()
+
+def iter_chunks(series, chunk_size=CHUNK_SIZE):
+    """
+    Splits a series that is already in memory into chunks
+    """
+    for start in range(0, len(series), chunk_size):
+        yield series.iloc[start:start + chunk_size]
+
+def iter_cached_chunks(path):
+    """
+    Reads a cached intraday series one record batch at a time without loading the rest of the file
+    """
+    import pyarrow as pa # only needed once there is a cached series
+
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).to_pandas()
+            yield batch.set_index("time")[batch.columns[-1]]
+
+def iter_player_day(client, day, resource="elevation", detail_level="1sec", cache_dir=fitbit_data.CACHE_DIR, account=None):
+    """
+    Streams a day of intraday samples, downloading the day first if it is not cached
+
+    The account, e.g. the wearer's name, keeps each wearer's cached days apart and is needed unless
+    cache_dir is None. The client can be a function that returns one so a wearer is only authorized
+    when their day is not cached.
+
+    Returns
+    -------
+    <chunks> : iterator of Series
+        climb in each sample indexed by timestamp
+    """
+    day = pd.Timestamp(day).date()
+    if cache_dir is not None:
+        for level in fitbit_data.DETAIL_LEVELS[fitbit_data.DETAIL_LEVELS.index(detail_level):]:
+            path = fitbit_data.get_cache_path(day, resource, level, account, cache_dir)
+            if os.path.exists(path):
+                return iter_cached_chunks(path)
+
+    if callable(client):
+        client = client()
+    series, _ = fitbit_data.get_intraday(client, day, resource, detail_level=detail_level, cache_dir=cache_dir, account=account)
+    return iter_chunks(series)
+
+def get_play_offsets(plays):
+    """
+    Gets how far into its match each play happened
+
+    The timestamps are stored as times of day but are really minutes and seconds into the match video.
+    """
+    times = [play['timestamp'] for play in plays if 'timestamp' in play.columns]
+    match_ids = [play['match_id'].astype(str) for play in plays if 'timestamp' in play.columns]
+    if not times:
+        return pd.Series(dtype='timedelta64[ns]')
+    offsets = pd.to_timedelta(pd.concat(times).astype(str), errors='coerce') / 60
+    return pd.Series(offsets.values, index=pd.concat(match_ids).values)
+
+def get_match_windows(stats, plays, session_starts, match_minutes=MATCH_MINUTES, break_minutes=BREAK_MINUTES):
+    """
+    Estimates when each match was played
+
+    Matches on a date are played back to back in the order they appear in the stats, starting when the
+    session starts. A match lasts match_minutes or until its latest play, whichever is longer, and is
+    followed by a break of break_minutes.
+
+    Parameters
+    ----------
+    stats : DataFrame
+        game rows with date and match_id columns
+    plays : dict or list of DataFrame
+        play sheets with match_id and timestamp columns
+    session_starts : dict
+        datetime.date mapped to the datetime the first match started - dates without a start are left out
+    match_minutes : int, default MATCH_MINUTES
+        shortest length of a match
+    break_minutes : int, default BREAK_MINUTES
+        time between matches
+
+    Returns
+    -------
+    <windows> : DataFrame
+        match_id, date, start, and end of each match sorted by start
+    """
+    plays = list(plays.values()) if isinstance(plays, dict) else list(plays)
+    latest_play = get_play_offsets(plays).groupby(level=0).max()
+    matches = stats[['date', 'match_id']].astype({'match_id': str}).drop_duplicates('match_id')
+
+    rows = []
+    for day, day_matches in matches.groupby(matches['date'].dt.date, sort=True):
+        if day not in session_starts:
+            continue
+        start = pd.Timestamp(session_starts[day])
+        for match_id in day_matches['match_id']:
+            length = max(pd.Timedelta(minutes=match_minutes), latest_play.get(match_id, pd.Timedelta(0)))
+            rows.append((match_id, day, start, start + length))
+            start += length + pd.Timedelta(minutes=break_minutes)
+
+    return pd.DataFrame(rows, columns=['match_id', 'date', 'start', 'end'])
+
+def count_jumps(events, windows):
+    """
+    Counts the jumps in each match window, consuming the events as they arrive
+
+    Parameters
+    ----------
+    events : iterable of JumpEvent
+        jumps in time order
+    windows : DataFrame
+        output of get_match_windows
+
+    Returns
+    -------
+    <counts> : Counter
+        number of jumps that started in each match keyed by match_id
+    """
+    starts = windows['start'].values.astype('datetime64[ns]')
+    ends = windows['end'].values.astype('datetime64[ns]')
+    match_ids = windows['match_id'].values
+    counts = Counter()
+    for event in events:
+        i = np.searchsorted(starts, np.datetime64(event.start, 'ns'), side='right') - 1
+        if i >= 0 and np.datetime64(event.start, 'ns') < ends[i]:
+            counts[match_ids[i]] += 1
+
+    return counts
+
+def _track_coverage(chunks, coverage):
+    """
+    Passes the chunks through, keeping the first and last timestamp seen in coverage
+    """
+    for chunk in chunks:
+        if len(chunk) > 0:
+            coverage[:] = [coverage[0] if coverage else chunk.index[0], chunk.index[-1]]
+        yield chunk
+
+def get_jumps_per_match(streams, windows, threshold=JUMP_THRESHOLD, min_gap_seconds=MIN_GAP_SECONDS):
+    """
+    Counts every player's jumps in each match, one stream at a time
+
+    Parameters
+    ----------
+    streams : iterable of (str, iterator of Series)
+        player wearing the device and the chunks of one of their days - consumed one at a time so only a
+        single chunk is held in memory
+    windows : DataFrame
+        output of get_match_windows
+    threshold : float, default JUMP_THRESHOLD
+        smallest climb in a single sample that counts towards a jump
+    min_gap_seconds : int, default MIN_GAP_SECONDS
+        active samples further apart than this are separate jumps
+
+    Returns
+    -------
+    <jumps> : DataFrame
+        match_id, name, and number of jumps in every match window covered by a stream
+    """
+    rows = []
+    for player, chunks in streams:
+        coverage = []
+        detector = JumpDetector(threshold=threshold, min_gap_seconds=min_gap_seconds)
+        counts = count_jumps(detector.detect(_track_coverage(chunks, coverage)), windows)
+        if not coverage:
+            continue
+        # matches the stream covered without any jumps get a zero rather than being left out
+        covered = windows[((windows['end'] > coverage[0]) & (windows['start'] <= coverage[1]))]
+        rows += [(match_id, player, counts.get(match_id, 0)) for match_id in covered['match_id']]
+        logger.info(f"Found {sum(counts.values())} jumps for {player}")
+
+    return pd.DataFrame(rows, columns=['match_id', 'name', 'jumps'])
+
+def add_jumps(stats, jumps):
+    """
+    Adds the number of jumps to each game row - rows without a stream for the player are NaN
+
+    Parameters
+    ----------
+    stats : DataFrame
+        game rows with match_id and name columns
+    jumps : DataFrame
+        output of get_jumps_per_match
+
+    Returns
+    -------
+    <stats> : DataFrame
+        copy of the stats with a "jumps" column
+    """
+    jumps = jumps.groupby(['match_id', 'name'], as_index=False)['jumps'].sum()
+    keys = pd.MultiIndex.from_arrays([stats['match_id'].astype(str), stats['name'].astype(str)])
+    stats = stats.copy()
+    stats['jumps'] = jumps.set_index(['match_id', 'name'])['jumps'].reindex(keys).values
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--date', required=True, help="Date of the session in the format MMDDYYYY", type=str)
+    parser.add_argument('-s', '--start', required=True, help="Time the first match started in the format HH:MM", type=str)
+    parser.add_argument('-p', '--players', nargs='+', required=True, help="Players that wore a Fitbit", type=str)
+    parser.add_argument('-r', '--resource', default="elevation", choices=["elevation", "floors"], help="Intraday resource to detect jumps in")
+    parser.add_argument('--fake', action='store_true', help="Generate the intraday data locally instead of using the Fitbit API")
+    parser.add_argument('--data-dir', default=None, help="Directory holding the workbook - defaults to the project's data/ directory", type=str)
+    args = parser.parse_args()
+
+    from match_summary import MatchSummary
+    summary = MatchSummary(None, data_dir=args.data_dir)
+    day = datetime.strptime(args.date, '%m%d%Y').date()
+    windows = get_match_windows(summary.data, summary.plays, {day: datetime.combine(day, datetime.strptime(args.start, '%H:%M').time())})
+
+    # each player's Fitbit is only authorized, through the browser, once their stream is reached and
+    # their day is not cached
+    if args.fake:
+        seeds = {player: seed for seed, player in enumerate(args.players)}
+        connect = lambda player: fitbit_data.FakeFitbitClient(seed=seeds[player])
+        cache_dir = None
+    else:
+        from settings import FITBIT_CLIENT_ID, FITBIT_CLIENT_SECRET # not tracked - holds the Fitbit application keys
+        connect = lambda player: fitbit_data.connect(FITBIT_CLIENT_ID, FITBIT_CLIENT_SECRET)
+        cache_dir = fitbit_data.CACHE_DIR
+    streams = ((player, iter_player_day(lambda player=player: connect(player), day, args.resource, cache_dir=cache_dir, account=player)) for player in args.players)
+
+    stats = add_jumps(summary.data[(summary.data['date'].dt.date == day)], get_jumps_per_match(streams, windows))
+    print(stats.loc[stats['jumps'].notna(), ['match_id', 'name', 'partner', 'win_loss', 'jumps']].to_string(index=False))
@@ -0,0 +1,77 @@
+# leaderboard metrics - the name each one is passed to the template as and whether a lower value is better
+METRICS = {
+    "win_rate": {"template_key": "win_rate", "lower_is_better": False},
+    "point_differential": {"template_key": "point_diff", "lower_is_better": False},
+    "effectiveness": {"template_key": "effectiveness", "lower_is_better": False},
+    "errors": {"template_key": "errors", "lower_is_better": True},
+    "kills": {"template_key": "kills", "lower_is_better": False},
+    "hitting_efficiency": {"template_key": "efficiency", "lower_is_better": False},
+    "serving_percentage": {"template_key": "serving", "lower_is_better": False},
+    "aces": {"template_key": "aces", "lower_is_better": False},
+    "ace2error": {"template_key": "ace2error", "lower_is_better": False},
+    "serve_receive_rating": {"template_key": "pass_rating", "lower_is_better": False},
+    "blocks": {"template_key": "blocks", "lower_is_better": False},
+    "blocking_efficiency": {"template_key": "block_eff", "lower_is_better": False},
+}
+
+def _select(values, n, best):
+    """
+    Gets the n best or worst values using partial selection rather than a full sort
+    """
+    if best:
+        return values.nlargest(n)
+    return values.nsmallest(n)
+
+def build_leaderboards(stats_per_game, changes, n_top_players=5, metrics=METRICS):
+    """
+    Builds the top, bottom, and most improved players for every metric at once
+
+    Parameters
+    ----------
+    stats_per_game : DataFrame
+        per player stats with a "name" column
+    changes : DataFrame
+        change in each stat since the previous report indexed by name
+    n_top_players : int, default 5
+        number of players to include on each leaderboard
+    metrics : dict, default METRICS
+        direction of each metric - columns missing from the registry are treated as higher is better
+
+    Returns
+    -------
+    results : dict
+        keyed by metric with "top", "bottom", and "mip" dictionaries mapping player to value
+    """
+    stats = stats_per_game.set_index('name')
+    results = {}
+    for variable in stats.columns:
+        lower_is_better = metrics.get(variable, {}).get("lower_is_better", False)
+        var_results = {}
+        var_results["top"] = _select(stats[variable], n_top_players, best=not lower_is_better).to_dict()
+        var_results["bottom"] = _select(stats[variable], n_top_players, best=lower_is_better).to_dict()
+        if variable in changes.columns:
+            var_results["mip"] = _select(changes[variable], n_top_players, best=not lower_is_better).to_dict()
+        else:
+            var_results["mip"] = {}
+
+        results[variable] = var_results
+
+    return results
+
+def get_template_leaderboards(results, metrics=METRICS):
+    """
+    Renames the leaderboards to the variables the report template expects
+
+    Parameters
+    ----------
+    results : dict
+        output of build_leaderboards
+    metrics : dict, default METRICS
+        registry holding the template name of each metric
+
+    Returns
+    -------
+    <leaderboards> : dict
+        leaderboards of the registered metrics keyed by their template name
+    """
+    return {metric["template_key"]: results[variable] for variable, metric in metrics.items() if variable in results}
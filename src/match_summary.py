@@ -1,17 +1,29 @@
+import os, sys
+import fnmatch
+import json
 import pandas as pd
 import pathlib
 import argparse
 
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.match_summary
+import data_cache
+from game_log import GameLog, PLAY_SHEETS
+from schema import apply_stats_schema, apply_play_schema, get_categories
+
 from datetime import datetime
 
 class MatchSummary:
 
-    def __init__(self,id) -> None:
+    def __init__(self,id,use_store=False,data_dir=None) -> None:
         """
         Parameters
         ----------
         id : str
-            ID for the match
+            ID for the match - None when describing several matches
+        use_store : boolean, default False
+            whether to read only this match (or every match if id is None) from the game log store rather than the whole workbook
+        data_dir : str, default None
+            directory holding the workbook. If None, the project's data/ directory is used
 
         Creates
         -------
@@ -19,36 +31,84 @@ class MatchSummary:
             copied from input; ID for the match
         data : DataFrame
             stats
+        plays : dict
+            DataFrame of each play sheet
+        match_index : dict
+            row positions of every match_id in each sheet
         """
         self.id = id
 
         # file paths
         self.path_to_this_dir = f"{pathlib.Path(__file__).resolve().parent}"
         self.project_dir = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+        self.data_dir = data_dir if data_dir is not None else f"{self.project_dir}/data"
+        self.store = GameLog(f"{self.data_dir}/game_log.sqlite") if use_store else None
+
+        # loading every sheet in one pass
+        if self.store is not None:
+            sheets = {"stats": self.store.games(match_id=self.id)}
+            for sheet in PLAY_SHEETS:
+                sheets[sheet] = self.store.plays(sheet, match_id=self.id)
+        else:
+            sheets = self.import_workbook_data()
 
-        # game stats
-        self.data = self.import_sheet_data("stats")
+        # game stats - rows that do not match the schema are dropped with a warning
+        self.data = apply_stats_schema(sheets["stats"], errors="drop")
+        sheets["stats"] = self.data
 
-        # play data
+        # play data - sharing the player and match categories of the stats
         self.plays = {}
-        for sheet in ["hammers","monster_blocks","superb_serves","great_defense","wow_plays"]:
-            self.plays[sheet] = self.import_sheet_data(sheet)
+        for sheet in PLAY_SHEETS:
+            self.plays[sheet] = apply_play_schema(sheets[sheet], categories=get_categories(self.data))
+            sheets[sheet] = self.plays[sheet]
+
+        # row positions of each match within each sheet
+        self.match_index = {}
+        for sheet, df in sheets.items():
+            self.match_index[sheet] = df.groupby('match_id', sort=False, observed=True).indices
+
+    def import_workbook_data(self,datetime_columns=["date"]):
+        """
+        Imports data from every sheet of the workbook at once
 
-    def import_sheet_data(self,sheet_name="stats",datetime_columns=["date"]):
+        Returns
+        -------
+        sheets : dict
+            DataFrame of the stats sheet and each play sheet keyed by the sheet name
         """
-        Imports data from the given sheet
+        workbook = data_cache.read_excel(f'{self.data_dir}/pickup_stats.xlsx',sheet_name=None)
+        sheets = {}
+        for sheet in ["stats"] + PLAY_SHEETS:
+            df = workbook[sheet]
+            for col in datetime_columns:
+                df[col] = pd.to_datetime(df[col])
+            # removing any columns that don't have data - "match_id" should always be included
+            sheets[sheet] = df.dropna(subset=['match_id'])
+        return sheets
+
+    def get_match_data(self, sheet, match_id):
         """
-        df = pd.read_excel(f'{self.project_dir}/data/pickup_stats.xlsx',sheet_name=sheet_name)
-        for col in datetime_columns:
-            df[col] = pd.to_datetime(df[col])
-        # removing any columns that don't have data - "match_id" should always be included
-        df.dropna(subset=['match_id'], inplace=True)
-        return df
+        Gets the rows of a sheet belonging to the given match
 
-    def generate_video_description(self, match_id=None, one_liner=None,
+        Parameters
+        ----------
+        sheet : str
+            "stats" or the name of one of the play sheets
+        match_id : str
+            unique game identifier
+
+        Returns
+        -------
+        <match_data> : DataFrame
+            rows for the match - empty if the match is not in the sheet
+        """
+        df = self.data if sheet == "stats" else self.plays[sheet]
+        return df.iloc[self.match_index[sheet].get(f"{match_id}", [])]
+
+    def format_video_description(self, match_id=None, one_liner=None,
     variables=['kills','serving_percentage','aces','hitting_efficiency','blocking_efficiency','errors']):
         """
-        Generates the descriptive stats for the video description
+        Formats the descriptive stats for the video description
         
         Parameters
         ----------
@@ -57,58 +117,59 @@ class MatchSummary:
         one_liner : str, default None
             quipy one-liner to include at the top. If None, nothing is included
             
-        Prints
-        ------
+        Returns
+        -------
         <description> : str
             text to place in the video description
         """
         if match_id is None:
             match_id = self.id
 
-        match_data = self.data[(self.data['match_id'] == f"{match_id}")]
+        lines = []
+
+        match_data = self.get_match_data("stats", match_id)
         players = []
         for player in match_data['name']:
             players.append(player)
         
         # output of players
-        print(f"{players[0].title()}/{players[1].title()} vs {players[2].title()}/{players[3].title()}\n\n")
+        lines.append(f"{players[0].title()}/{players[1].title()} vs {players[2].title()}/{players[3].title()}\n\n")
         
         # one liner
         if one_liner:
-            print(one_liner)
-            print()
+            lines.append(one_liner)
+            lines.append("")
 
         # winning team and score
         team1_points = match_data.iloc[0]['points_for']
         team2_points = match_data.iloc[0]['points_against']
-        winner1 = match_data[(match_data['win_loss'] == 'win')].iloc[0]['name']
-        winner2 = match_data[(match_data['win_loss'] == 'win')].iloc[1]['name']
-        print(f"{int(team1_points)} - {int(team2_points)} Game {winner1}/{winner2}\n")
+        winner1 = match_data[match_data['win']].iloc[0]['name']
+        winner2 = match_data[match_data['win']].iloc[1]['name']
+        lines.append(f"{int(team1_points)} - {int(team2_points)} Game {winner1}/{winner2}\n")
 
         # switches
         # switches are given with the winning team's score first in the data so the order
         # might need to be reversed if the winning team is the second team listed
-        print("Switches:")
+        lines.append("Switches:")
         for i in range(8):
-            switch_str = match_data.iloc[0][f"switch{i+1}"]
-            if str(switch_str).lower() != "nan":
+            score_winner = match_data.iloc[0][f"switch{i+1}_winner"]
+            score_loser = match_data.iloc[0][f"switch{i+1}_loser"]
+            if not pd.isna(score_winner):
                 if winner1 == match_data.iloc[0]["name"]: # switches are in order already
-                    print(switch_str)
+                    lines.append(f"{score_winner} - {score_loser}")
                 else:
-                    score_winner = switch_str.split(" - ")[0]
-                    score_loser = switch_str.split(" - ")[1]
-                    print(f"{score_loser} - {score_winner}")
-        print()
+                    lines.append(f"{score_loser} - {score_winner}")
+        lines.append("")
 
         # plays
-        for play_name, play_data in self.plays.items():
-            play_data_match = play_data[play_data["match_id"] == match_id]
+        for play_name in self.plays:
+            play_data_match = self.get_match_data(play_name, match_id)
             if len(play_data_match) > 0:
-                print(f'{play_name.replace("_"," ").title()}:')
+                lines.append(f'{play_name.replace("_"," ").title()}:')
                 for player, ts in zip(play_data_match["name"],play_data_match["timestamp"]):
-                    print(f"{player.title()} {ts.hour}:{ts.minute}") # datetime.time thinks format is HH:MM:SS when it is really MM:SS
+                    lines.append(f"{player.title()} {ts.hour}:{ts.minute}") # datetime.time thinks format is HH:MM:SS when it is really MM:SS
 
-                print()
+                lines.append("")
         
         # player-specific stats summary
         for player in match_data['name']:
@@ -119,39 +180,154 @@ class MatchSummary:
                     sign_annot = '+'
                 else:
                     sign_annot = ''
-                print(f"{player.title()} ({sign_annot}{effectiveness})")
+                lines.append(f"{player.title()} ({sign_annot}{effectiveness})")
                 # looping through remaining variables
                 for variable in variables:
                     value = player_data[variable].values[0]
                     if variable == "hitting_efficiency":
                         swings = int(player_data["swings"].values[0])
-                        print(f"\tSwings: {swings} ({round(value * 100, 1)}%)")
+                        lines.append(f"\tSwings: {swings} ({round(value * 100, 1)}%)")
                     elif variable == "serving_percentage":
                         serves = int(player_data["serves"].values[0])
-                        print(f"\tServes: {serves} ({round(value * 100, 1)}%)")
+                        lines.append(f"\tServes: {serves} ({round(value * 100, 1)}%)")
                     elif variable == "blocking_efficiency":
                         blocks = int(player_data["blocks"].values[0])
-                        print(f"\tBlocks: {blocks} ({round(value * 100, 1)}%)") 
+                        lines.append(f"\tBlocks: {blocks} ({round(value * 100, 1)}%)") 
                     else:
                         try:
                             value = int(value)
                         except ValueError:
                             value = 0
                     
-                        print(f"\t{variable.replace('_', ' ').title()}: {value}")
+                        lines.append(f"\t{variable.replace('_', ' ').title()}: {value}")
             except ValueError:
                 pass
                     
-            print()
+            lines.append("")
+            
+        lines.append(f"Match ID: {match_id}")
+        return "\n".join(lines) + "\n"
+
+    def generate_video_description(self, match_id=None, one_liner=None,
+    variables=['kills','serving_percentage','aces','hitting_efficiency','blocking_efficiency','errors']):
+        """
+        Generates the descriptive stats for the video description
+        
+        Parameters
+        ----------
+        match_id : str
+            unique game identifier
+        one_liner : str, default None
+            quipy one-liner to include at the top. If None, nothing is included
             
-        print("Match ID:", match_id)
+        Prints
+        ------
+        <description> : str
+            text to place in the video description
+        """
+        print(self.format_video_description(match_id=match_id, one_liner=one_liner, variables=variables), end="")
+
+
+    def select_matches(self, start=None, end=None, pattern=None):
+        """
+        Gets the match IDs in the stats sheet that fall within the given filters
+
+        Parameters
+        ----------
+        start : datetime.date, default None
+            first match date to include
+        end : datetime.date, default None
+            last match date to include
+        pattern : str, default None
+            shell-style pattern the match ID has to match e.g. "08062022_*"
+
+        Returns
+        -------
+        <match_ids> : list of str
+            match IDs in the order they appear in the stats sheet
+        """
+        # one grouped pass for the date of every match
+        match_dates = self.data.groupby('match_id', sort=False, observed=True)['date'].first().dt.date
+        if start is not None:
+            match_dates = match_dates[(match_dates >= start)]
+        if end is not None:
+            match_dates = match_dates[(match_dates <= end)]
+
+        match_ids = [f"{match_id}" for match_id in match_dates.index]
+        if pattern is not None:
+            match_ids = fnmatch.filter(match_ids, pattern)
+        return match_ids
+
+    def export_video_descriptions(self, match_ids, output_dir=None, jsonl_path=None):
+        """
+        Writes the video description of every given match
+
+        Parameters
+        ----------
+        match_ids : list of str
+            matches to write descriptions for
+        output_dir : str, default None
+            directory to write one {match_id}.txt file per match to
+        jsonl_path : str, default None
+            file to write one {"match_id", "description"} JSON object per line to
+
+        Returns
+        -------
+        <failed> : dict
+            match IDs that could not be described mapped to the error
+        """
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+        jsonl_file = open(jsonl_path, 'w') if jsonl_path is not None else None
+
+        failed = {}
+        for match_id in match_ids:
+            try:
+                description = self.format_video_description(match_id=match_id)
+            except (IndexError, KeyError, ValueError) as e: # typically a match without all four players
+                failed[match_id] = f"{type(e).__name__}: {e}"
+                continue
+
+            if output_dir is not None:
+                with open(f"{output_dir}/{match_id}.txt", 'w') as f:
+                    f.write(description)
+            if jsonl_file is not None:
+                jsonl_file.write(json.dumps({"match_id": match_id, "description": description}) + "\n")
+
+        if jsonl_file is not None:
+            jsonl_file.close()
+        return failed
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', help='ID of the match, typically in the form of mmddyyyy_n where "n" refers the game number for that day', default='02082022_1',type=str)    
+    parser.add_argument('--store', help='read the match from the game log store instead of the workbook', action='store_true')
+    parser.add_argument('--all', help='write descriptions for every match instead of printing one', action='store_true')
+    parser.add_argument('--from', dest='from_date', help='write descriptions for matches on or after this date - string in format %m%d%Y', type=str)
+    parser.add_argument('--to', dest='to_date', help='write descriptions for matches on or before this date - string in format %m%d%Y', type=str)
+    parser.add_argument('--pattern', help='write descriptions for match IDs matching this shell-style pattern e.g. "08062022_*"', type=str)
+    parser.add_argument('-o', help='directory to write one text file per match to - defaults to descriptions/ when no --jsonl is given', type=str)
+    parser.add_argument('--jsonl', help='file to write every description to as JSON lines', type=str)
+    parser.add_argument('--data-dir', help='directory holding the workbook - defaults to data/', default=None, type=str)
     args = parser.parse_args()
 
-    # Generating the Report
-    # ---------------------
-    summary = MatchSummary(args.i)
-    summary.generate_video_description()
\ No newline at end of file
+    if args.all or args.from_date or args.to_date or args.pattern:
+        # Exporting Several Descriptions
+        # ------------------------------
+        summary = MatchSummary(None, use_store=args.store, data_dir=args.data_dir)
+        start = datetime.strptime(args.from_date, '%m%d%Y').date() if args.from_date else None
+        end = datetime.strptime(args.to_date, '%m%d%Y').date() if args.to_date else None
+        match_ids = summary.select_matches(start=start, end=end, pattern=args.pattern)
+        output_dir = args.o
+        if output_dir is None and args.jsonl is None:
+            output_dir = f"{summary.project_dir}/descriptions"
+
+        failed = summary.export_video_descriptions(match_ids, output_dir=output_dir, jsonl_path=args.jsonl)
+        print(f"Wrote {len(match_ids) - len(failed)} of {len(match_ids)} descriptions")
+        for match_id, error in failed.items():
+            print(f"\t{match_id}: {error}")
+    else:
+        # Generating the Report
+        # ---------------------
+        summary = MatchSummary(args.i, use_store=args.store, data_dir=args.data_dir)
+        summary.generate_video_description()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import argparse
+import hashlib
+import json
+import logging
+import pathlib
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+MANIFEST_FILE = "pdf_manifest.json"
+QUEUE_FILE = "pdf_queue.json"
+
+def hash_file(path):
+    """
+    Gets the SHA-256 hash of a file's contents
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+def _read_json(path, default):
+    """
+    Reads a JSON file, returning the default if it is missing or cannot be parsed
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _write_json(path, obj):
+    """
+    Writes a JSON file through a temporary file so a reader never sees it half written
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+
+    os.replace(tmp_path, path)
+
+class PdfConverter:
+
+    def __init__(self, max_workers=2, reports_dir=f"{PROJECT_DIR}/reports") -> None:
+        """
+        Converts HTML reports to PDF on a bounded pool of background threads
+
+        Each conversion is an external wkhtmltopdf process so threads are enough to run
+        several at once. Conversions are skipped when the HTML has the same hash as the
+        HTML the existing PDF was made from.
+
+        Parameters
+        ----------
+        max_workers : int, default 2
+            maximum number of conversions running at once
+        reports_dir : str, default PROJECT_DIR/reports
+            directory holding the manifest of source hashes
+
+        Creates
+        -------
+        manifest : dict
+            PDF file name mapped to the hash of the HTML it was converted from
+        """
+        self.manifest_path = f"{reports_dir}/{MANIFEST_FILE}"
+        self.manifest = _read_json(self.manifest_path, {})
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def convert(self, html_path, pdf_path):
+        """
+        Converts a single report unless the PDF is already up to date
+
+        Parameters
+        ----------
+        html_path : str
+            location of the HTML report
+        pdf_path : str
+            location of the PDF to create
+
+        Returns
+        -------
+        <status> : str
+            "converted" or "skipped"
+        """
+        source_hash = hash_file(html_path)
+        pdf_name = os.path.basename(pdf_path)
+        with self.lock:
+            up_to_date = self.manifest.get(pdf_name) == source_hash and os.path.exists(pdf_path)
+        if up_to_date:
+            logger.info(f"Skipping {pdf_name} - HTML is unchanged")
+            return "skipped"
+
+        import pdfkit # only imported once there is a PDF to convert
+        pdfkit.from_file(html_path, pdf_path)
+        with self.lock:
+            self.manifest[pdf_name] = source_hash
+            _write_json(self.manifest_path, self.manifest)
+        logger.info(f"Converted {pdf_name}")
+        return "converted"
+
+    def submit(self, html_path, pdf_path):
+        """
+        Queues a conversion on the pool
+
+        Returns
+        -------
+        <future> : concurrent.futures.Future
+            resolves to the status from convert() or raises the conversion error
+        """
+        return self.pool.submit(self.convert, html_path, pdf_path)
+
+    def close(self):
+        """
+        Waits for every submitted conversion to finish
+        """
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        """
+        Uses the converter as a context manager that waits for its conversions on exit
+        """
+        return self
+
+    def __exit__(self, *exc):
+        """
+        Waits for every submitted conversion to finish
+        """
+        self.close()
+
+def queue_conversion(html_path, pdf_path, reports_dir=f"{PROJECT_DIR}/reports"):
+    """
+    Records a conversion to run later with `python src/pdf_pipeline.py`
+    """
+    queue_path = f"{reports_dir}/{QUEUE_FILE}"
+    queue = _read_json(queue_path, [])
+    entry = {"html": html_path, "pdf": pdf_path}
+    if entry not in queue:
+        queue.append(entry)
+        _write_json(queue_path, queue)
+
+def convert_queue(max_workers=2, reports_dir=f"{PROJECT_DIR}/reports"):
+    """
+    Converts every queued report, keeping the ones that fail in the queue
+
+    Returns
+    -------
+    <results> : dict
+        PDF path mapped to the status or the error from the conversion
+    """
+    queue_path = f"{reports_dir}/{QUEUE_FILE}"
+    queue = _read_json(queue_path, [])
+    results = {}
+    failed = []
+    with PdfConverter(max_workers=max_workers, reports_dir=reports_dir) as converter:
+        futures = [(entry, converter.submit(entry["html"], entry["pdf"])) for entry in queue]
+        for entry, future in futures:
+            try:
+                results[entry["pdf"]] = future.result()
+            except Exception as e:
+                logger.error(f"Unable to convert {entry['html']}: {e}")
+                results[entry["pdf"]] = f"{type(e).__name__}: {e}"
+                failed.append(entry)
+
+    _write_json(queue_path, failed)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', help='maximum number of conversions running at once', default=2, type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for pdf_path, status in convert_queue(max_workers=args.w).items():
+        print(f"{pdf_path}: {status}")
@@ -0,0 +1,264 @@
+import os, sys
+import json
+import logging
+import math
+import pathlib
+
+from datetime import date
+
+import pandas as pd
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.ratings
+from stats_engine import get_match_rows
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "rating_state.json"
+INITIAL_RATING = 1500
+# rating difference at which the stronger team is expected to win ten times as often
+SCALE = 400
+K_FACTOR = 24
+# new players move faster until their rating has settled - stands in for the uncertainty of a TrueSkill rating
+PROVISIONAL_GAMES = 10
+PROVISIONAL_K_FACTOR = 48
+
+def get_matches(data):
+    """
+    Splits every match into its winning and losing team
+
+    Parameters
+    ----------
+    data : DataFrame
+        game rows with the schema applied - four rows per match
+
+    Returns
+    -------
+    <matches> : DataFrame
+        one row per match with the match_id, date, winner1, winner2, loser1, loser2, and margin - in the
+        order the matches are rated
+    """
+    rows = get_match_rows(data)
+    names = data['name'].astype(str).to_numpy(dtype=object)[rows]
+    first = rows[:, 0]
+    return pd.DataFrame({
+        'match_id': data['match_id'].astype(str).to_numpy(dtype=object)[first],
+        'date': pd.to_datetime(data['date']).values[first],
+        'winner1': names[:, 0], 'winner2': names[:, 1],
+        'loser1': names[:, 2], 'loser2': names[:, 3],
+        'margin': (data['points_for'].astype(float) - data['points_against'].astype(float)).abs().values[first],
+    })
+
+def get_margin_multiplier(margin, rating_difference):
+    """
+    Scales a rating change by the margin of victory
+
+    Big wins count for more, damped when the favorite wins so strong teams do not keep inflating each other
+    """
+    return math.log(margin + 1) * 2.2 / (rating_difference * 0.001 + 2.2)
+
+class RatingEngine:
+
+    def __init__(self, initial_rating=INITIAL_RATING, k_factor=K_FACTOR, provisional_games=PROVISIONAL_GAMES, provisional_k_factor=PROVISIONAL_K_FACTOR) -> None:
+        """
+        Elo ratings for doubles, updated one match at a time
+
+        Each team plays at the average of its players' ratings and every player on the team moves by
+        the team's result against that expectation, scaled by the margin of victory.
+
+        Parameters
+        ----------
+        initial_rating : int, default INITIAL_RATING
+            rating of a player's first game
+        k_factor : int, default K_FACTOR
+            largest change in rating from a single game
+        provisional_games : int, default PROVISIONAL_GAMES
+            number of games a player's rating uses provisional_k_factor for
+        provisional_k_factor : int, default PROVISIONAL_K_FACTOR
+            largest change in rating from a single game while the rating is provisional
+
+        Creates
+        -------
+        ratings : dict
+            current rating of each player
+        games : dict
+            number of games each player has been rated on
+        history : dict
+            each player's [date, rating] after the last match of every date they played
+        match_ids : set
+            matches that have already been rated
+        last_date : datetime.date
+            date of the latest match rated or None if nothing has been rated
+        """
+        self.params = {"initial_rating": initial_rating, "k_factor": k_factor,
+                       "provisional_games": provisional_games, "provisional_k_factor": provisional_k_factor}
+        self.ratings = {}
+        self.games = {}
+        self.history = {}
+        self.match_ids = set()
+        self.last_date = None
+
+    @classmethod
+    def load(cls, path, **params):
+        """
+        Restores the engine checkpointed at the given path - a new engine is returned if there is no
+        checkpoint or it was saved with different parameters
+        """
+        engine = cls(**params)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return engine
+
+        if state.get("params") != engine.params:
+            logger.info(f"Rating parameters changed - rebuilding {path}")
+            return engine
+
+        engine.ratings = state["ratings"]
+        engine.games = state["games"]
+        engine.history = state["history"]
+        engine.match_ids = set(state["match_ids"])
+        engine.last_date = date.fromisoformat(state["last_date"]) if state["last_date"] else None
+        return engine
+
+    def save(self, path):
+        """
+        Checkpoints the engine to disk
+        """
+        state = {
+            "params": self.params,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+            "match_ids": sorted(self.match_ids),
+            "ratings": self.ratings,
+            "games": self.games,
+            "history": self.history,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+
+        os.replace(tmp_path, path)
+
+    def get_k_factor(self, player):
+        """
+        Gets the largest change in rating from the player's next game - larger while the rating is provisional
+        """
+        if self.games.get(player, 0) < self.params["provisional_games"]:
+            return self.params["provisional_k_factor"]
+        return self.params["k_factor"]
+
+    def rate_match(self, winners, losers, margin, date_str):
+        """
+        Updates the ratings of the four players in a match
+
+        Parameters
+        ----------
+        winners : tuple of str
+            players on the winning team
+        losers : tuple of str
+            players on the losing team
+        margin : float
+            difference in points - NaN counts as a one point win
+        date_str : str
+            ISO date of the match for the rating history
+        """
+        initial = self.params["initial_rating"]
+        winning_rating = sum(self.ratings.get(player, initial) for player in winners) / 2
+        losing_rating = sum(self.ratings.get(player, initial) for player in losers) / 2
+        expected = 1 / (1 + 10 ** ((losing_rating - winning_rating) / SCALE))
+        change = (1 - expected) * get_margin_multiplier(1 if math.isnan(margin) else margin, winning_rating - losing_rating)
+
+        for players, sign in ((winners, 1), (losers, -1)):
+            for player in players:
+                rating = self.ratings.get(player, initial) + sign * self.get_k_factor(player) * change
+                self.ratings[player] = rating
+                self.games[player] = self.games.get(player, 0) + 1
+                history = self.history.setdefault(player, [])
+                if history and history[-1][0] == date_str: # only the rating at the end of each date is kept
+                    history[-1][1] = rating
+                else:
+                    history.append([date_str, rating])
+
+    def update(self, data):
+        """
+        Rates the matches that have not been rated yet
+
+        If a new match is dated before the latest match already rated, every match is rated again from
+        scratch since ratings depend on the order of the matches. Matches that cannot be rated, i.e.
+        without two winners and two losers, are left out before that check so they never cause a rebuild.
+
+        Parameters
+        ----------
+        data : DataFrame
+            game rows with the schema applied - may include matches that were already rated
+
+        Returns
+        -------
+        <n_new> : int
+            number of matches rated
+        """
+        matches = get_matches(data[(~data['match_id'].astype(str).isin(self.match_ids))])
+        if len(matches) == 0:
+            return 0
+        if self.last_date is not None and matches['date'].min().date() < self.last_date:
+            logger.info("Matches were added out of order - rebuilding the ratings")
+            self.ratings, self.games, self.history, self.match_ids, self.last_date = {}, {}, {}, set(), None
+            matches = get_matches(data)
+
+        for match in matches.itertuples(index=False):
+            self.rate_match((match.winner1, match.winner2), (match.loser1, match.loser2), match.margin, match.date.date().isoformat())
+
+        self.match_ids.update(matches['match_id'])
+        self.last_date = max(matches['date'].max().date(), self.last_date or date.min)
+        return len(matches)
+
+    def get_rating_history(self):
+        """
+        Gets every player's rating over time
+
+        Returns
+        -------
+        <history> : Series
+            rating after the last match of each date indexed by name and date
+        """
+        rows = [(player, date_str, rating) for player, history in self.history.items() for date_str, rating in history]
+        history = pd.DataFrame(rows, columns=['name', 'date', 'rating'])
+        history['date'] = pd.to_datetime(history['date'])
+        return history.set_index(['name', 'date'])['rating']
+
+    def get_ratings(self, since=None, min_games=1, decimals=0):
+        """
+        Gets every player's current rating
+
+        Parameters
+        ----------
+        since : datetime.date, default None
+            date to measure the change in rating from - the rating at the end of that date or the
+            initial rating if the player had not played yet. If None, no change is included
+        min_games : int, default 1
+            players with fewer rated games are left out
+        decimals : int, default 0
+            number of decimals to round the ratings to
+
+        Returns
+        -------
+        <ratings> : DataFrame
+            indexed by name with the rating, number of games, and change in rating sorted from highest rated
+        """
+        rows = {}
+        for player, rating in self.ratings.items():
+            if self.games[player] < min_games:
+                continue
+            row = {"rating": round(rating, decimals), "games": self.games[player]}
+            if since is not None:
+                previous = self.params["initial_rating"]
+                for date_str, value in self.history[player]:
+                    if date_str > since.isoformat():
+                        break
+                    previous = value
+                row["change"] = round(rating - previous, decimals)
+            rows[player] = row
+
+        ratings = pd.DataFrame.from_dict(rows, orient="index", columns=["rating", "games"] + (["change"] if since is not None else []))
+        ratings.index.name = "name"
+        return ratings.sort_values("rating", ascending=False)
@@ -0,0 +1,54 @@
+import os
+import functools
+
+@functools.lru_cache(maxsize=None)
+def get_environment(template_dir, cache_dir):
+    """
+    Gets the template environment, keeping compiled templates in memory and as bytecode on disk
+
+    Parameters
+    ----------
+    template_dir : str
+        directory holding the templates
+    cache_dir : str
+        directory to store the compiled template bytecode in
+
+    Returns
+    -------
+    <env> : jinja2.Environment
+        environment shared by every report rendered by this process
+    """
+    import jinja2 # only imported once there is a report to render
+
+    os.makedirs(cache_dir, exist_ok=True)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(searchpath=template_dir),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(cache_dir),
+        auto_reload=True, # recompiles if the template file changes
+    )
+
+def render_report(template_dir, template_file, path, context, cache_dir):
+    """
+    Renders a template straight to a file
+
+    Parameters
+    ----------
+    template_dir : str
+        directory holding the templates
+    template_file : str
+        name of the template within template_dir
+    path : str
+        location of the rendered file
+    context : dict
+        every value the template needs - no functions are exposed to the template
+        so rendering never triggers any stat calculations
+    cache_dir : str
+        directory to store the compiled template bytecode in
+    """
+    template = get_environment(template_dir, cache_dir).get_template(template_file)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        for chunk in template.generate(**context):
+            f.write(chunk)
+
+    os.replace(tmp_path, path)
@@ -0,0 +1,279 @@
+import os, sys
+import json
+import logging
+import math
+import pathlib
+
+from collections import deque
+from datetime import date
+
+import pandas as pd
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.rolling_form
+from leaderboard import METRICS
+
+logger = logging.getLogger(__name__)
+
+# stats tracked for current form - win_rate comes from the win flag
+FORM_VARIABLES = ['win_rate', 'effectiveness', 'hitting_efficiency', 'serving_percentage', 'errors']
+# form stats stored as fractions that are reported as percentages
+FORM_PERCENT_VARIABLES = ('win_rate', 'hitting_efficiency', 'serving_percentage')
+STATE_FILE = "form_state.json"
+# number of games in the last-N average
+FORM_WINDOW = 10
+
+class PlayerForm:
+
+    def __init__(self, window) -> None:
+        """
+        Running last-N and exponentially weighted averages for a single player
+
+        Parameters
+        ----------
+        window : int
+            number of games in the last-N average
+
+        Creates
+        -------
+        recent : dict
+            last window values of each variable - NaN where the stat was not recorded
+        sums : dict
+            sum of the recorded values in recent
+        counts : dict
+            number of recorded values in recent
+        ewm : dict
+            exponentially weighted average of each variable or None before the first recorded value
+        games : int
+            number of games seen
+        """
+        self.recent = {variable: deque(maxlen=window) for variable in FORM_VARIABLES}
+        self.sums = {variable: 0.0 for variable in FORM_VARIABLES}
+        self.counts = {variable: 0 for variable in FORM_VARIABLES}
+        self.ewm = {variable: None for variable in FORM_VARIABLES}
+        self.games = 0
+
+    def add_game(self, values, alpha):
+        """
+        Adds one game in constant time
+
+        Parameters
+        ----------
+        values : dict
+            value of each of FORM_VARIABLES - NaN if the stat was not recorded
+        alpha : float
+            weight of the new game in the exponentially weighted average
+        """
+        for variable in FORM_VARIABLES:
+            value = float(values[variable])
+            recent = self.recent[variable]
+            if len(recent) == recent.maxlen: # the oldest game drops out of the window
+                oldest = recent[0]
+                if not math.isnan(oldest):
+                    self.sums[variable] -= oldest
+                    self.counts[variable] -= 1
+            recent.append(value)
+            if not math.isnan(value):
+                self.sums[variable] += value
+                self.counts[variable] += 1
+                previous = self.ewm[variable]
+                self.ewm[variable] = value if previous is None else alpha * value + (1 - alpha) * previous
+
+        self.games += 1
+
+    def to_dict(self):
+        """
+        Gets the form as JSON-serializable values for the state file
+        """
+        return {
+            "recent": {variable: list(values) for variable, values in self.recent.items()},
+            "ewm": self.ewm,
+            "games": self.games,
+        }
+
+    @classmethod
+    def from_dict(cls, state, window):
+        """
+        Restores the form saved by to_dict, keeping only the last window games
+        """
+        form = cls(window)
+        for variable in FORM_VARIABLES:
+            # the sums are rebuilt from the window rather than stored so they never drift
+            for value in state["recent"][variable][-window:]:
+                form.recent[variable].append(float(value))
+                if not math.isnan(value):
+                    form.sums[variable] += value
+                    form.counts[variable] += 1
+        form.ewm = state["ewm"]
+        form.games = state["games"]
+        return form
+
+class FormTracker:
+
+    def __init__(self, window=FORM_WINDOW, alpha=None) -> None:
+        """
+        Keeps every player's current form, updated one game at a time
+
+        Parameters
+        ----------
+        window : int, default 10
+            number of games in the last-N average
+        alpha : float, default None
+            weight of the newest game in the exponentially weighted average. If None, 2 / (window + 1)
+            so the average has the same center of mass as the last-N average
+
+        Creates
+        -------
+        players : dict
+            PlayerForm of each player
+        match_ids : set
+            matches that have already been added
+        last_date : datetime.date
+            date of the latest match added or None if nothing has been added
+        """
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2 / (window + 1)
+        self.players = {}
+        self.match_ids = set()
+        self.last_date = None
+
+    @classmethod
+    def load(cls, path, window=FORM_WINDOW, alpha=None):
+        """
+        Restores the tracker saved at the given path - a new tracker is returned if there is no
+        saved state or it was saved with different parameters
+        """
+        tracker = cls(window=window, alpha=alpha)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return tracker
+
+        if state.get("window") != tracker.window or state.get("alpha") != tracker.alpha:
+            logger.info(f"Form parameters changed - rebuilding {path}")
+            return tracker
+
+        tracker.players = {player: PlayerForm.from_dict(form, window) for player, form in state["players"].items()}
+        tracker.match_ids = set(state["match_ids"])
+        tracker.last_date = date.fromisoformat(state["last_date"]) if state["last_date"] else None
+        return tracker
+
+    def save(self, path):
+        """
+        Writes the tracker to disk
+        """
+        state = {
+            "window": self.window,
+            "alpha": self.alpha,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+            "match_ids": sorted(self.match_ids),
+            "players": {player: form.to_dict() for player, form in self.players.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f) # NaN is written as a bare NaN token which json reads back
+
+        os.replace(tmp_path, path)
+
+    def update(self, data):
+        """
+        Adds the games from matches that have not been added yet
+
+        Games are added in date order, keeping the workbook order within a date. If a new match is
+        dated before the latest match already added, the running averages would be out of order so
+        every game is added again from scratch.
+
+        Parameters
+        ----------
+        data : DataFrame
+            game rows with the schema applied - may include matches that were already added
+
+        Returns
+        -------
+        <n_new> : int
+            number of rows added
+        """
+        new = data[(~data['match_id'].astype(str).isin(self.match_ids))]
+        if len(new) == 0:
+            return 0
+        if self.last_date is not None and new['date'].min().date() < self.last_date:
+            logger.info("Matches were added out of order - rebuilding the current form")
+            self.players, self.match_ids, self.last_date = {}, set(), None
+            new = data
+
+        new = new.sort_values('date', kind='stable')
+        columns = {
+            'win_rate': new['win'].astype(float).values,
+            **{variable: new[variable].astype(float).values for variable in FORM_VARIABLES if variable != 'win_rate'},
+        }
+        for i, player in enumerate(new['name'].astype(str).values):
+            if player not in self.players:
+                self.players[player] = PlayerForm(self.window)
+            self.players[player].add_game({variable: values[i] for variable, values in columns.items()}, self.alpha)
+
+        self.match_ids.update(new['match_id'].astype(str).unique())
+        self.last_date = new['date'].max().date()
+        return len(new)
+
+    def get_form(self, min_games=1, decimals=1):
+        """
+        Gets every player's current form
+
+        Parameters
+        ----------
+        min_games : int, default 1
+            players with fewer games are left out
+        decimals : int, default 1
+            number of decimals to round the averages to
+
+        Returns
+        -------
+        <form> : DataFrame
+            indexed by name with the number of games and, for each variable, the last-N average
+            ("<variable>_last") and the exponentially weighted average ("<variable>_ewm")
+        """
+        rows = {}
+        for player, form in self.players.items():
+            if form.games < min_games:
+                continue
+            row = {"games": form.games}
+            for variable in FORM_VARIABLES:
+                scale = 100 if variable in FORM_PERCENT_VARIABLES else 1
+                last = form.sums[variable] / form.counts[variable] if form.counts[variable] else float("nan")
+                ewm = form.ewm[variable] if form.ewm[variable] is not None else float("nan")
+                row[f"{variable}_last"] = round(last * scale, decimals)
+                row[f"{variable}_ewm"] = round(ewm * scale, decimals)
+            rows[player] = row
+
+        form = pd.DataFrame.from_dict(rows, orient="index", columns=["games"] + [f"{variable}_{kind}" for variable in FORM_VARIABLES for kind in ("last", "ewm")])
+        form.index.name = "name"
+        return form
+
+def get_form_leaderboards(form, n_top_players=5, metrics=METRICS):
+    """
+    Gets the players in the best current form for each variable, ranked by the exponentially weighted average
+
+    Parameters
+    ----------
+    form : DataFrame
+        output of FormTracker.get_form
+    n_top_players : int, default 5
+        number of players to include on each leaderboard
+    metrics : dict, default METRICS
+        registry with the direction of each metric
+
+    Returns
+    -------
+    <leaderboards> : dict
+        keyed by variable with a dictionary mapping player to their (weighted average, last-N average)
+    """
+    leaderboards = {}
+    for variable in FORM_VARIABLES:
+        ewm = form[f"{variable}_ewm"].dropna()
+        if metrics.get(variable, {}).get("lower_is_better", False):
+            top = ewm.nsmallest(n_top_players)
+        else:
+            top = ewm.nlargest(n_top_players)
+        leaderboards[variable] = {player: (value, form.loc[player, f"{variable}_last"]) for player, value in top.items()}
+
+    return leaderboards
@@ -0,0 +1,167 @@
+import os
+import contextlib
+import json
+import logging
+import time
+
+from datetime import datetime
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+def get_max_rss():
+    """
+    Gets the most resident memory this process has used in MB or None where it cannot be measured - on
+    Linux this only goes back to the last reset_peak_rss()
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS reports bytes
+    return round(peak / (1024 ** 2 if os.uname().sysname == "Darwin" else 1024), 1)
+
+def get_rss():
+    """
+    Gets the resident memory of this process right now in MB or None where it cannot be measured
+    """
+    try:
+        with open("/proc/self/statm") as f: # Linux only
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+def get_peak_rss():
+    """
+    Gets the most resident memory this process has used since reset_peak_rss() in MB or None where it
+    cannot be measured
+    """
+    try:
+        with open("/proc/self/status") as f: # Linux only
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+def reset_peak_rss():
+    """
+    Resets the peak read by get_peak_rss() to the current resident memory
+
+    Returns
+    -------
+    <reset> : boolean
+        whether the peak could be reset - only on Linux
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+
+    return True
+
+def _max(*values):
+    """
+    Gets the largest of the values that were measured or None if none were
+    """
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+class RunMetrics:
+
+    def __init__(self, name) -> None:
+        """
+        Records how long each stage of a run takes along with row counts and memory
+
+        Parameters
+        ----------
+        name : str
+            what is being run e.g. the report date
+
+        Creates
+        -------
+        spans : list of dict
+            stage, seconds, peak resident memory, and any details recorded by the stage - in the order
+            the stages finished. Stages run within another stage have a depth greater than 0
+        """
+        self.name = name
+        self.started = datetime.now()
+        self.spans = []
+        self.depth = 0
+        # running peak of each open span - the innermost last
+        self.peaks = []
+        self.max_rss = None
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """
+        Times a stage, recording it even if the stage raises
+
+        The peak resident memory is reset when the stage starts so it only covers the stage, with the
+        peak so far handed to the enclosing stage first. Where it cannot be reset, the larger of the
+        resident memory at the start and end of the stage is recorded instead, which misses anything
+        freed within the stage.
+
+        Yields
+        ------
+        <details> : dict
+            filled in by the stage with anything worth recording e.g. {"rows": 1200}
+        """
+        details = {}
+        if self.peaks:
+            self.peaks[-1] = _max(self.peaks[-1], get_peak_rss())
+        reset = reset_peak_rss()
+        self.peaks.append(get_rss())
+        start = time.perf_counter()
+        error = None
+        depth = self.depth
+        self.depth += 1
+        try:
+            yield details
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.depth = depth
+            seconds = round(time.perf_counter() - start, 4)
+            peak = _max(self.peaks.pop(), get_peak_rss() if reset else get_rss())
+            if self.peaks:
+                self.peaks[-1] = _max(self.peaks[-1], peak)
+            self.max_rss = _max(self.max_rss, peak)
+            span = {"stage": stage, "depth": depth, "seconds": seconds, "peak_rss_mb": None if peak is None else round(peak, 1), **details}
+            if error is not None:
+                span["error"] = error
+            self.spans.append(span)
+            logger.info(f"{stage} took {span['seconds']:.3f}s{'' if error is None else ' and failed'}")
+
+    def to_dict(self):
+        """
+        Gets the metrics as JSON-serializable values
+        """
+        return {
+            "name": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "total_seconds": round(sum(span["seconds"] for span in self.spans if span["depth"] == 0), 4),
+            # the stages reset the process's own peak so theirs is included
+            "max_rss_mb": _max(get_max_rss(), None if self.max_rss is None else round(self.max_rss, 1)),
+            "spans": self.spans,
+        }
+
+    def save(self, path):
+        """
+        Writes the metrics to a JSON file
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+        os.replace(tmp_path, path)
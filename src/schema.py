@@ -0,0 +1,247 @@
+import logging
+
+import pandas as pd, numpy as np
+
+logger = logging.getLogger(__name__)
+
+# columns every game row needs
+REQUIRED_COLUMNS = ['date', 'name', 'win_loss', 'points_for', 'points_against', 'match_id']
+# whole number counts - stored as the smallest integer type when nothing is missing
+COUNT_COLUMNS = ['points_for', 'points_against', 'serves', 'aces', 'missed_serves', 'received', 'swings', 'swing_kills',
+                 'blocks', 'block_kills', 'bump_kills', 'hitting_errors', 'errors', 'kills', 'positive']
+SIGNED_COUNT_COLUMNS = ['effectiveness']
+# repeated strings other than the player names and match IDs
+CATEGORY_COLUMNS = ['win_loss', 'tournament']
+WIN_LOSS = ('win', 'loss')
+# switches are stored in the workbook as "<winning team's score> - <losing team's score>"
+N_SWITCHES = 8
+SWITCH_COLUMNS = [f"switch{i+1}" for i in range(N_SWITCHES)]
+SWITCH_SCORE_COLUMNS = [f"switch{i+1}_{team}" for i in range(N_SWITCHES) for team in ("winner", "loser")]
+SWITCH_PATTERN = r"^\s*(\d{1,2})\s*-\s*(\d{1,2})\s*$"
+
+class SchemaError(ValueError):
+    """
+    Raised when rows of a game table do not match the schema
+    """
+
+def get_categories(data):
+    """
+    Gets the player and match ID categories of a typed table so another table can share them
+
+    Returns
+    -------
+    <categories> : dict
+        "player" and "match_id" categories
+    """
+    return {"player": data['name'].cat.categories, "match_id": data['match_id'].cat.categories}
+
+def _to_category(values, categories=None):
+    """
+    Converts values to a categorical whose categories are the sorted union of the given categories and the values
+    """
+    # only the distinct values are converted and sorted - every row just gets an integer code
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    uniques = pd.Index(uniques).astype(str)
+    all_categories = uniques if categories is None else uniques.union(pd.Index(categories))
+    all_categories = all_categories.unique().sort_values()
+    # the trailing -1 is picked by the missing values' sentinel
+    positions = np.append(all_categories.get_indexer(uniques), -1)
+    return pd.Categorical.from_codes(positions[codes], categories=all_categories)
+
+def _parse_scores(values):
+    """
+    Parses "<winner> - <loser>" scores, matching each distinct string only once
+
+    Returns
+    -------
+    <winner> : ndarray
+        winning team's score - NaN where the value is missing or malformed
+    <loser> : ndarray
+        losing team's score - NaN where the value is missing or malformed
+    <malformed> : ndarray
+        True where a value is present but is not a score
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    parsed = pd.Series(uniques, dtype=object).astype(str).str.extract(SWITCH_PATTERN).astype(float)
+    # the sentinel for missing values picks the trailing NaN row
+    winner = np.append(parsed[0].values, np.nan)[codes]
+    loser = np.append(parsed[1].values, np.nan)[codes]
+    malformed = np.append(parsed[0].isna().values, False)[codes]
+    return winner, loser, malformed
+
+def _to_number(values):
+    """
+    Converts a column to numbers with anything that is not a number as NaN
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    return pd.to_numeric(values, errors='coerce')
+
+def find_invalid_rows(data):
+    """
+    Finds the rows that do not match the schema
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw game rows as read from the "stats" sheet
+
+    Returns
+    -------
+    <reasons> : Series
+        why each invalid row was rejected indexed by the row - empty if every row is valid
+    """
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in data.columns]
+    if missing_columns:
+        raise SchemaError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    # every check is vectorized - the reasons are only written out for the rows that fail
+    checks = []
+    for col in REQUIRED_COLUMNS:
+        checks.append((data[col].isna().values, f"missing {col}"))
+    checks.append(((data['win_loss'].notna() & ~data['win_loss'].isin(WIN_LOSS)).values, f"win_loss is not {' or '.join(WIN_LOSS)}"))
+    for col in [col for col in COUNT_COLUMNS + SIGNED_COUNT_COLUMNS if col in data.columns]:
+        values = _to_number(data[col])
+        checks.append(((data[col].notna() & values.isna()).values, f"{col} is not a number"))
+        checks.append(((values.notna() & (values != values.round())).values, f"{col} is not a whole number"))
+        if col in COUNT_COLUMNS:
+            checks.append(((values < 0).values, f"{col} is negative"))
+    for col in [col for col in SWITCH_COLUMNS if col in data.columns]:
+        checks.append((_parse_scores(data[col])[2], f"{col} is not a score like \"7 - 5\""))
+
+    invalid = np.logical_or.reduce([mask for mask, _ in checks])
+    reasons = {}
+    for row in np.flatnonzero(invalid):
+        reasons[data.index[row]] = "; ".join(reason for mask, reason in checks if mask[row])
+    return pd.Series(reasons, dtype=object)
+
+def parse_switches(data):
+    """
+    Parses the switch columns into the winning and losing team's score at each switch
+
+    Returns
+    -------
+    <scores> : DataFrame
+        nullable small integer columns named switch<i>_winner and switch<i>_loser - missing switches are <NA>
+    """
+    scores = {}
+    for col in SWITCH_COLUMNS:
+        if col in data.columns:
+            winner, loser, _ = _parse_scores(data[col])
+        else:
+            winner = loser = np.full(len(data), np.nan)
+        scores[f"{col}_winner"] = pd.array(winner, dtype="Int8")
+        scores[f"{col}_loser"] = pd.array(loser, dtype="Int8")
+
+    return pd.DataFrame(scores, index=data.index)
+
+def is_typed(data):
+    """
+    Checks whether the schema has already been applied to a table
+    """
+    return 'win' in data.columns and isinstance(data['name'].dtype, pd.CategoricalDtype)
+
+def apply_stats_schema(data, categories=None, errors="raise"):
+    """
+    Converts the raw "stats" sheet to compact types, rejecting the rows that do not match the schema
+
+    Player names (name and partner share one set of categories) and match IDs become categoricals so
+    filters on them compare integer codes, win_loss gets a boolean "win" flag alongside it, counts are
+    downcast, and the switch strings are parsed into small integers.
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw game rows as read from the "stats" sheet - tables that are already typed only have their categories extended
+    categories : dict, default None
+        "player" and "match_id" categories to share with another table e.g. get_categories(other) - values
+        that are missing from them are added
+    errors : str, default "raise"
+        "raise" raises a SchemaError listing the invalid rows and "drop" removes them, along with the
+        rest of their matches, with a warning
+
+    Returns
+    -------
+    <typed> : DataFrame
+        the valid rows with the compact types
+    """
+    if is_typed(data):
+        if categories is None:
+            return data
+        typed = data.copy()
+        players = typed['name'].cat.categories.union(categories["player"])
+        typed['name'] = typed['name'].cat.set_categories(players)
+        typed['partner'] = typed['partner'].cat.set_categories(players)
+        typed['match_id'] = typed['match_id'].cat.set_categories(typed['match_id'].cat.categories.union(categories["match_id"]))
+        return typed
+
+    data = data.dropna(how='all')
+    reasons = find_invalid_rows(data)
+    if len(reasons) > 0:
+        # rows are numbered as they are in the workbook - the header is row 1
+        details = "\n".join(f"\trow {row + 2 if isinstance(row, (int, np.integer)) else row}: {reason}" for row, reason in reasons.items())
+        if errors == "raise":
+            raise SchemaError(f"{len(reasons)} rows do not match the schema:\n{details}")
+        logger.warning(f"Dropping {len(reasons)} rows that do not match the schema:\n{details}")
+        # the rest of an invalid row's match goes with it - a match without all four rows would still count
+        # towards the games, partnerships, and form
+        invalid = data.index.isin(reasons.index)
+        if 'match_id' in data.columns:
+            match_ids = data.loc[invalid, 'match_id'].dropna().astype(str).unique()
+            in_match = data['match_id'].astype(str).isin(match_ids).values
+            if (in_match & ~invalid).any():
+                logger.warning(f"Dropping the rest of the matches with invalid rows: {', '.join(match_ids)}")
+            invalid |= in_match
+        data = data[(~invalid)]
+
+    typed = pd.DataFrame(index=data.index)
+    players = categories["player"] if categories is not None else None
+    match_ids = categories["match_id"] if categories is not None else None
+    for col in data.columns:
+        if col in SWITCH_COLUMNS:
+            continue
+        elif col == 'date':
+            typed[col] = pd.to_datetime(data[col])
+        elif col == 'name':
+            # one set of categories for both columns so names and partners can be compared directly
+            partner = data['partner'] if 'partner' in data.columns else pd.Series(np.nan, index=data.index)
+            players = _to_category(pd.concat([data['name'], partner]), players).categories
+            typed[col] = _to_category(data[col], players)
+        elif col == 'partner':
+            continue # set once the player categories are known
+        elif col == 'match_id':
+            typed[col] = _to_category(data[col], match_ids)
+        elif col in CATEGORY_COLUMNS:
+            typed[col] = _to_category(data[col])
+        elif col in COUNT_COLUMNS + SIGNED_COUNT_COLUMNS:
+            values = _to_number(data[col])
+            # missing counts stay as floats so they remain NaN
+            typed[col] = pd.to_numeric(values, downcast='integer') if values.notna().all() else values
+        else:
+            typed[col] = data[col]
+
+    if 'partner' in data.columns:
+        typed.insert(data.columns.get_loc('partner'), 'partner', _to_category(data['partner'], players))
+    typed.insert(typed.columns.get_loc('win_loss') + 1, 'win', (data['win_loss'] == 'win').values)
+    return pd.concat([typed, parse_switches(data)], axis=1)
+
+def apply_play_schema(df, categories=None):
+    """
+    Converts a play sheet to compact types - the name and match ID share the categories of the "stats" sheet
+
+    Parameters
+    ----------
+    df : DataFrame
+        raw rows as read from one of the play sheets
+    categories : dict, default None
+        "player" and "match_id" categories to share e.g. get_categories(stats)
+
+    Returns
+    -------
+    <typed> : DataFrame
+        the rows with categorical names and match IDs
+    """
+    typed = df.copy()
+    typed['name'] = _to_category(df['name'], categories["player"] if categories is not None else None)
+    typed['match_id'] = _to_category(df['match_id'], categories["match_id"] if categories is not None else None)
+    return typed
@@ -0,0 +1,175 @@
+import os, sys
+import argparse
+import bisect
+import glob
+import hashlib
+import json
+import logging
+import pathlib
+
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.snapshot_catalog
+import data_cache
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+
+class SnapshotCatalog:
+
+    def __init__(self, data_dir=f"{PROJECT_DIR}/data", index_file="snapshots.json") -> None:
+        """
+        Persistent index of the dated pickup_stats snapshots
+
+        Parameters
+        ----------
+        data_dir : str, default PROJECT_DIR/data
+            directory holding the pickup_stats_{mmddyyyy}.xlsx snapshots
+        index_file : str, default "snapshots.json"
+            name of the index file within data_dir
+
+        Creates
+        -------
+        snapshots : list of dict
+            date, path, size, mtime, row count, date of the last game, and content hash for each
+            snapshot - sorted by date
+        """
+        self.data_dir = data_dir
+        self.index_path = f"{data_dir}/{index_file}"
+
+        self.snapshots = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.snapshots = json.load(f)["snapshots"]
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Adds new snapshots and updates changed ones, only touching files whose size or mtime changed
+
+        Returns
+        -------
+        <changed> : boolean
+            whether the index was updated
+        """
+        known = {snapshot["path"]: snapshot for snapshot in self.snapshots}
+        snapshots = []
+        changed = False
+        for path in glob.glob(f"{self.data_dir}/pickup_stats_*.xlsx"):
+            file_name = os.path.basename(path)
+            str_from_file = file_name.split('_')[(-1)].split('.')[0]
+            try:
+                file_date = datetime.strptime(str_from_file, '%m%d%Y').date()
+            except ValueError:
+                logger.warning(f"Skipping snapshot with unrecognized date: {file_name}")
+                continue
+
+            stat = os.stat(path)
+            snapshot = known.get(file_name)
+            # entries indexed before the last game was recorded are described again
+            if snapshot is None or snapshot["size"] != stat.st_size or snapshot["mtime"] != stat.st_mtime_ns or "last_game" not in snapshot:
+                snapshot = self.describe(path, file_date, stat)
+                changed = True
+            snapshots.append(snapshot)
+
+        if len(snapshots) != len(self.snapshots):
+            changed = True # snapshots were removed
+
+        self.snapshots = sorted(snapshots, key=lambda snapshot: snapshot["date"])
+        if changed:
+            self.save()
+
+        return changed
+
+    def describe(self, path, file_date, stat):
+        """
+        Builds the index entry for a single snapshot
+        """
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+
+        data = data_cache.read_excel(path)
+        last_game = pd.to_datetime(data['date']).max()
+        return {
+            "date": file_date.isoformat(),
+            "path": os.path.basename(path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "rows": int(data['date'].notna().sum()),
+            "last_game": None if pd.isna(last_game) else last_game.date().isoformat(),
+            "hash": sha.hexdigest(),
+        }
+
+    def save(self):
+        """
+        Writes the index to disk
+        """
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"snapshots": self.snapshots}, f, indent=2)
+
+        os.replace(tmp_path, self.index_path)
+
+    def latest_before(self, date):
+        """
+        Gets the latest snapshot strictly before the given date
+
+        Parameters
+        ----------
+        date : datetime.date
+            date to search before
+
+        Returns
+        -------
+        <snapshot> : dict or None
+            index entry of the snapshot or None if there is no earlier snapshot
+        """
+        dates = [snapshot["date"] for snapshot in self.snapshots]
+        i = bisect.bisect_left(dates, date.isoformat())
+        if i == 0:
+            return None
+
+        return self.snapshots[i - 1]
+
+    def get(self, date):
+        """
+        Gets the snapshot taken on the given date or None if there is not one
+        """
+        for snapshot in self.snapshots:
+            if snapshot["date"] == date.isoformat():
+                return snapshot
+
+        return None
+
+    def get_last_game(self, snapshot):
+        """
+        Gets the date of the last game in the snapshot - slicing other data as of this date gives the
+        games the snapshot held, which may stop well before the date in its file name
+        """
+        if snapshot["last_game"] is None:
+            return datetime.strptime(snapshot["date"], '%Y-%m-%d').date()
+        return datetime.strptime(snapshot["last_game"], '%Y-%m-%d').date()
+
+    def get_path(self, snapshot):
+        """
+        Gets the full path to the snapshot's workbook
+        """
+        return f"{self.data_dir}/{snapshot['path']}"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', help='if given, prints the latest snapshot before this date - should be string in format %m%d%Y', default=None, type=str)
+    args = parser.parse_args()
+
+    catalog = SnapshotCatalog()
+    if args.d:
+        print(catalog.latest_before(datetime.strptime(args.d, '%m%d%Y').date()))
+    else:
+        for snapshot in catalog.snapshots:
+            print(f"{snapshot['date']}\t{snapshot['rows']}\t{snapshot['path']}")
@@ -0,0 +1,205 @@
+import sys
+import logging
+import pathlib
+
+import pandas as pd, numpy as np
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.stats_engine
+from schema import SWITCH_COLUMNS, SWITCH_SCORE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# columns that describe the game rather than the player's performance
+NON_STAT_COLUMNS = ['date', 'partner','win_loss', 'win', 'match_id','tournament'] + SWITCH_COLUMNS + SWITCH_SCORE_COLUMNS
+# columns stored as fractions that are reported as percentages
+PERCENT_COLUMNS = ("hitting_efficiency", "serving_percentage", "blocking_efficiency")
+
+def get_wins(data):
+    """
+    Gets whether each row is a win - from the "win" flag when the schema has been applied
+    """
+    if 'win' in data.columns:
+        return data['win']
+    return data['win_loss'] == 'win'
+
+def get_match_rows(data):
+    """
+    Splits every match into its winning and losing team in a single vectorized pass
+
+    Matches are kept in date order and in the order they appear in the data within a date. Matches
+    without exactly two winners and two losers are left out with a warning.
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw data with four rows per match
+
+    Returns
+    -------
+    <rows> : ndarray
+        positions of each match's rows in the data, one match per row ordered [winner, winner, loser, loser]
+    """
+    dates = pd.to_datetime(data['date']).values
+    # mergesort is stable so matches on the same date keep the order they appear in
+    by_date = np.argsort(dates, kind='mergesort')
+    codes, match_ids = pd.factorize(data['match_id'].astype(str).values[by_date])
+    wins = get_wins(data).values.astype(bool)[by_date]
+    # winners first within each match so every match reshapes to [winner, winner, loser, loser]
+    order = np.lexsort((~wins, codes))
+
+    n_rows = np.bincount(codes, minlength=len(match_ids))
+    n_wins = np.bincount(codes, weights=wins, minlength=len(match_ids))
+    valid = (n_rows == 4) & (n_wins == 2)
+    if not valid.all():
+        logger.warning(f"Skipping matches without two winners and two losers: {', '.join(match_ids[~valid])}")
+
+    order = order[valid[codes[order]]]
+    return by_date[order].reshape(-1, 4)
+
+def calculate_per_player_stats(data, decimals=1):
+    """
+    Calculates the per game stats for every player in a single grouped pass
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw data with one row per player per game
+    decimals : int, default 1
+        number of decimals to round the stats to
+
+    Returns
+    -------
+    stats_per_game : DataFrame
+        average stats per participant with the calculated stats (n, win rate,
+        ace:error ratio, and point differential) as the final columns
+    """
+    stat_columns = [col for col in data.columns if col not in NON_STAT_COLUMNS]
+    mean_columns = [col for col in stat_columns if col != 'name']
+
+    # per-row values that feed the calculated stats
+    aces = data['aces'].astype(float)
+    missed_serves = data['missed_serves'].astype(float)
+    games_with_aces_and_errors = (aces > 0) & (missed_serves > 0)
+    row_values = data[mean_columns].astype(float)
+    row_values['win'] = get_wins(data).astype(float)
+    row_values['has_aces'] = (aces > 0).astype(float)
+    row_values['ace2error'] = (aces / missed_serves).where(games_with_aces_and_errors)
+    row_values['point_differential'] = data['points_for'].astype(float) / data['points_against'].astype(float)
+
+    # single pass over the data - sort=False keeps players in order of first appearance
+    grouped = row_values.groupby(data['name'], sort=False, observed=True)
+    means = grouped.mean()
+    n = grouped.size()
+
+    # every column is rounded at once and the table is built in one step rather than a column at a time
+    scale = pd.Series([100.0 if col in PERCENT_COLUMNS else 1.0 for col in mean_columns], index=mean_columns)
+    rounded = (means[mean_columns] * scale).round(decimals)
+    columns = {col: (means.index.values if col == 'name' else rounded[col].values) for col in stat_columns}
+    columns['n'] = n.values
+    columns['win_rate'] = (means['win'] * 100).round(decimals).values
+    # players that never hit an ace get a ratio of zero
+    columns['ace2error'] = means['ace2error'].where(grouped['has_aces'].max() > 0, 0).round(decimals).values
+    columns['point_differential'] = means['point_differential'].round(decimals).values
+
+    return pd.DataFrame(columns)
+
+def calculate_cumulative_stats(data, variables):
+    """
+    Calculates every player's running win rate and running means in a single grouped cumulative pass
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw data with one row per player per game
+    variables : list of str
+        columns to calculate the running mean for - "win_rate" is calculated from the wins
+
+    Returns
+    -------
+    stats_over_time : DataFrame
+        indexed by name and date with one column per variable holding the value
+        using every game up to and including that date
+    """
+    mean_variables = [variable for variable in variables if variable != 'win_rate']
+    values = data[mean_variables].astype(float)
+    sums = pd.DataFrame({'name': data['name'].values, 'date': pd.to_datetime(data['date']).values})
+    sums['n'] = 1
+    sums['win'] = get_wins(data).values.astype(int)
+    for variable in mean_variables:
+        # missing values are skipped the same way the mean skips them
+        sums[f"{variable}_sum"] = values[variable].fillna(0).values
+        sums[f"{variable}_count"] = values[variable].notna().values.astype(int)
+
+    # totals per date and then running totals per player
+    daily = sums.groupby(['name', 'date'], sort=True, observed=True).sum()
+    running = daily.groupby(level='name', observed=True).cumsum()
+
+    stats_over_time = pd.DataFrame(index=running.index)
+    for variable in variables:
+        if variable == 'win_rate':
+            stats_over_time[variable] = (running['win'] / running['n'] * 100).round(1)
+        else:
+            stats_over_time[variable] = running[f"{variable}_sum"] / running[f"{variable}_count"]
+
+    return stats_over_time
+
+def calculate_partnership_stats(data):
+    """
+    Calculates the record of every partnership in a single grouped pass
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw data with one row per player per game
+
+    Returns
+    -------
+    partnerships : DataFrame
+        indexed by team ("A/B" with the names in alphabetical order) with the number of
+        games, wins, win rate, and average point differential of each partnership
+    """
+    data = data.dropna(subset=['partner'])
+    names = data['name'].astype(str).values
+    partners = data['partner'].astype(str).values
+    # canonical key so both partners' rows land on the same team
+    first = np.where(names <= partners, names, partners)
+    second = np.where(names <= partners, partners, names)
+
+    games = pd.DataFrame({
+        'team': pd.Series(first, dtype=object) + '/' + pd.Series(second, dtype=object),
+        'match_id': data['match_id'].values,
+        'win': get_wins(data).values.astype(int),
+        'point_differential': (data['points_for'].astype(float) / data['points_against'].astype(float)).values,
+    })
+    # both partners have a row for every game they play together
+    games = games.drop_duplicates(subset=['team', 'match_id'])
+
+    partnerships = games.groupby('team', sort=True).agg(
+        games=('win', 'size'),
+        wins=('win', 'sum'),
+        point_differential=('point_differential', 'mean'),
+    )
+    partnerships.insert(2, 'win_rate', partnerships['wins'] / partnerships['games'])
+    return partnerships
+
+def get_top_partnerships(partnerships, top_teams=5, min_games=5):
+    """
+    Gets the partnerships with the highest win rate
+
+    Parameters
+    ----------
+    partnerships : DataFrame
+        output of calculate_partnership_stats
+    top_teams : int, default 5
+        maximum number of teams to include
+    min_games : int, default 5
+        minimum number of games required to include team as possibility
+
+    Returns
+    -------
+    <top> : DataFrame
+        up to top_teams rows of the partnership table ordered by win rate and then
+        number of games - fewer rows if fewer teams qualify
+    """
+    qualified = partnerships[(partnerships['games'] >= min_games)]
+    return qualified.sort_values(['win_rate', 'games'], ascending=False).head(top_teams)
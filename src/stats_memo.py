@@ -0,0 +1,174 @@
+import os, sys
+import hashlib
+import json
+import logging
+import pathlib
+
+from collections import OrderedDict
+
+import pandas as pd, numpy as np
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.stats_memo
+from stats_engine import NON_STAT_COLUMNS, calculate_per_player_stats, get_wins
+
+logger = logging.getLogger(__name__)
+
+# players kept in memory - enough for every player across a season of snapshots at a couple of roundings
+MAX_ENTRIES = 4096
+MEMO_FILE = "player_stats.json"
+
+def get_fingerprints(data, return_codes=False):
+    """
+    Gets a fingerprint of each player's rows that only changes when their stats would
+
+    Only the columns the per game stats are calculated from are used, as floats so a column stored
+    with a different type in another snapshot gives the same fingerprint.
+
+    Parameters
+    ----------
+    data : DataFrame
+        raw data with one row per player per game
+    return_codes : boolean, default False
+        whether to also return which player each row belongs to
+
+    Returns
+    -------
+    <fingerprints> : dict
+        player mapped to their fingerprint - in the order the players first appear
+    <codes> : ndarray
+        position of each row's player in the fingerprints - only when return_codes is True
+    """
+    stat_columns = [col for col in data.columns if col not in NON_STAT_COLUMNS and col != 'name']
+    values = np.empty((len(data), len(stat_columns) + 1))
+    values[:, :-1] = data[stat_columns].to_numpy(dtype=float, na_value=np.nan)
+    values[:, -1] = get_wins(data).to_numpy(dtype=float)
+    columns_key = json.dumps(stat_columns).encode()
+
+    # factorizing the categorical itself only touches the codes
+    codes, players = pd.factorize(data['name'])
+    players = [f"{player}" for player in players]
+    # each player's rows next to each other, keeping the order they appear in
+    order = np.argsort(codes, kind='stable')
+    values = values[order]
+    bounds = np.searchsorted(codes[order], np.arange(len(players) + 1))
+    fingerprints = {}
+    for i, player in enumerate(players):
+        fingerprints[player] = hashlib.sha1(columns_key + player.encode() + values[bounds[i]:bounds[i + 1]].tobytes()).hexdigest()
+
+    if return_codes:
+        return fingerprints, codes
+    return fingerprints
+
+class PlayerStatsMemo:
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None) -> None:
+        """
+        Per game stats of each player keyed by the fingerprint of their rows so only players with new or
+        changed games are calculated
+
+        Parameters
+        ----------
+        max_entries : int, default MAX_ENTRIES
+            number of player stats to keep - the least recently used are dropped first
+        path : str, default None
+            JSON file to load the memo from and save it to. If None, the memo only lives in memory
+
+        Creates
+        -------
+        entries : OrderedDict
+            stats row of each "<fingerprint>-<decimals>" in order of use
+        hits : int
+            number of players whose stats were reused
+        misses : int
+            number of players whose stats were calculated
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    def load(self):
+        """
+        Restores the memo from its file if there is one
+        """
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        self.entries = OrderedDict((key, (tuple(columns), np.array(values, dtype=float))) for key, (columns, values) in list(entries.items())[-self.max_entries:])
+
+    def save(self):
+        """
+        Writes the memo to its file
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            # NaN is written as a bare NaN token which json reads back
+            json.dump({key: (columns, values.tolist()) for key, (columns, values) in self.entries.items()}, f)
+
+        os.replace(tmp_path, self.path)
+
+    def _put(self, key, entry):
+        """
+        Stores an entry as the most recently used, dropping the least recently used once there are too many
+        """
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_stats(self, data, decimals=1):
+        """
+        Gets the same table as calculate_per_player_stats, only calculating the players that are not memoized
+
+        Parameters
+        ----------
+        data : DataFrame
+            raw data with one row per player per game
+        decimals : int, default 1
+            number of decimals to round the stats to
+
+        Returns
+        -------
+        stats_per_game : DataFrame
+            average stats per participant in the order the players first appear
+        """
+        fingerprints, codes = get_fingerprints(data, return_codes=True)
+        keys = {player: f"{fingerprint}-{decimals}" for player, fingerprint in fingerprints.items()}
+        if not keys:
+            return calculate_per_player_stats(data, decimals=decimals)
+
+        entries = {key: self.entries[key] for key in keys.values() if key in self.entries}
+        is_dirty = np.array([key not in entries for key in keys.values()])
+        dirty = [player for player, key in keys.items() if key not in entries]
+        if dirty:
+            # one grouped pass over only the dirty players' rows
+            dirty_data = data if len(dirty) == len(keys) else data[is_dirty[codes]]
+            calculated = calculate_per_player_stats(dirty_data, decimals=decimals)
+            # each player's stats are kept as a row of floats - the names are added back from the keys
+            columns = tuple(calculated.columns)
+            values = calculated.drop(columns='name').to_numpy(dtype=float)
+            for player, row in zip(calculated['name'].astype(str), values):
+                entries[keys[player]] = (columns, row)
+
+        self.misses += len(dirty)
+        self.hits += len(keys) - len(dirty)
+        logger.info(f"Calculated per game stats for {len(dirty)} of {len(keys)} players")
+        for key in keys.values():
+            self._put(key, entries[key])
+
+        columns = entries[next(iter(keys.values()))][0]
+        values = np.vstack([entries[key][1] for key in keys.values()])
+        stat_columns = [col for col in columns if col != 'name']
+        table = {col: values[:, i] for i, col in enumerate(stat_columns)}
+        table['name'] = list(keys)
+        if isinstance(data['name'].dtype, pd.CategoricalDtype):
+            table['name'] = pd.Categorical(table['name'], categories=data['name'].cat.categories)
+        table['n'] = table['n'].astype('int64')
+        return pd.DataFrame({col: table[col] for col in columns})
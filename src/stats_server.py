@@ -0,0 +1,225 @@
+import os, sys
+import argparse
+import glob
+import json
+import logging
+import pathlib
+import threading
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+sys.path.append(f"{pathlib.Path(__file__).resolve().parent}") # so sibling modules resolve when imported as src.stats_server
+from generate_report import Report
+from match_summary import MatchSummary
+from snapshot_catalog import SnapshotCatalog
+from stats_memo import PlayerStatsMemo
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+
+class StatsService:
+
+    def __init__(self, date_str=None, poll_interval=2.0, data_dir=None) -> None:
+        """
+        Keeps the match descriptions and player stats in memory and reloads them when the workbooks change
+
+        Parameters
+        ----------
+        date_str : str, default None
+            report date in form "%m%d%Y" for the player stats. If None, the latest snapshot is used
+        poll_interval : float, default 2.0
+            seconds between checks of the workbooks' modification times
+        data_dir : str, default None
+            directory holding the workbooks. If None, the project's data/ directory is used
+
+        Creates
+        -------
+        summary : MatchSummary
+            every match indexed by match_id
+        per_player : dict
+            simplified stats per player from the report
+        stats_memo : PlayerStatsMemo
+            per player stats kept between reloads so only players with new or changed games are calculated
+        """
+        self.date_str = date_str
+        self.data_dir = data_dir if data_dir is not None else f"{PROJECT_DIR}/data"
+        self.stats_memo = PlayerStatsMemo()
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.mtimes = {}
+        self.summary = None
+        self.per_player = {}
+        self.report_date = None
+        self.check_for_changes()
+
+    def get_mtimes(self):
+        """
+        Gets the modification time of every pickup_stats workbook
+        """
+        return {path: os.stat(path).st_mtime_ns for path in glob.glob(f"{self.data_dir}/pickup_stats*.xlsx")}
+
+    def load_summary(self):
+        """
+        Reloads the match data from the master workbook - read from the feather cache if only the snapshots changed
+        """
+        summary = MatchSummary(None, data_dir=self.data_dir)
+        with self.lock:
+            self.summary = summary
+        logger.info(f"Loaded {len(summary.match_index['stats'])} matches")
+
+    def load_report(self):
+        """
+        Reloads the player stats from the report date's snapshot
+
+        The report is built again but unchanged workbooks come from the feather cache and only players
+        with new or changed games are calculated.
+        """
+        date_str = self.date_str
+        if date_str is None:
+            catalog = SnapshotCatalog(data_dir=self.data_dir)
+            if not catalog.snapshots:
+                logger.warning("No snapshots to load player stats from")
+                return
+            date_str = datetime.strptime(catalog.snapshots[-1]["date"], '%Y-%m-%d').strftime('%m%d%Y')
+
+        report = Report(date_str, stats_memo=self.stats_memo, data_dir=self.data_dir)
+        per_player = report.get_simplified_results_per_player()
+        with self.lock:
+            self.per_player = per_player
+            self.report_date = report.date
+        logger.info(f"Loaded stats for {len(per_player)} players as of {report.date}")
+
+    def check_for_changes(self):
+        """
+        Reloads only the datasets whose workbooks were added, removed, or modified
+        """
+        mtimes = self.get_mtimes()
+        changed = {path for path in set(mtimes) | set(self.mtimes) if mtimes.get(path) != self.mtimes.get(path)}
+        if not changed:
+            return
+
+        master = f"{self.data_dir}/pickup_stats.xlsx"
+        if master in changed:
+            # a removed master workbook leaves the previous matches in place
+            self.reload({master}, mtimes, self.load_summary if master in mtimes else None)
+        if changed - {master}:
+            self.reload(changed - {master}, mtimes, self.load_report)
+
+    def reload(self, paths, mtimes, load):
+        """
+        Runs a dataset's load and only then records its workbooks' modification times, so a failed load,
+        e.g. from a half-saved workbook, is tried again on the next check
+        """
+        try:
+            if load is not None:
+                load()
+        except Exception as e:
+            logger.exception(e) # keeps serving the previous data
+            return
+
+        for path in paths:
+            if path in mtimes:
+                self.mtimes[path] = mtimes[path]
+            else:
+                self.mtimes.pop(path, None)
+
+    def watch(self):
+        """
+        Polls the workbooks until stop() is called
+        """
+        while not self.stopped.wait(self.poll_interval):
+            self.check_for_changes()
+
+    def stop(self):
+        """
+        Ends watch() after its current check
+        """
+        self.stopped.set()
+
+    def describe_match(self, match_id):
+        """
+        Gets the video description for a match or None if the match does not exist
+        """
+        with self.lock:
+            summary = self.summary
+        if summary is None or match_id not in summary.match_index["stats"]:
+            return None
+
+        return summary.format_video_description(match_id=match_id)
+
+    def get_player(self, player):
+        """
+        Gets the simplified stats for a player or None if the player is not in the report
+        """
+        with self.lock:
+            return self.per_player.get(player.title())
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves GET /match/<match_id>, /players, and /player/<name> from the service on the server
+    """
+
+    def send(self, status, body, content_type="application/json"):
+        """
+        Writes a complete response with the body encoded as UTF-8
+        """
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """
+        Routes the request to the service, answering 404 for unknown paths, matches, and players
+        """
+        service = self.server.service
+        parts = [unquote(part) for part in self.path.split("?")[0].strip("/").split("/")]
+        if parts[0] == "match" and len(parts) == 2:
+            description = service.describe_match(parts[1])
+            if description is not None:
+                return self.send(200, description, content_type="text/plain")
+        elif parts[0] == "player" and len(parts) == 2:
+            stats = service.get_player(parts[1])
+            if stats is not None:
+                return self.send(200, json.dumps(stats))
+        elif parts[0] == "players" and len(parts) == 1:
+            with service.lock:
+                body = {"date": f"{service.report_date}", "players": sorted(service.per_player)}
+            return self.send(200, json.dumps(body))
+
+        self.send(404, json.dumps({"error": f"Nothing found at {self.path}"}))
+
+    def log_message(self, format, *args):
+        """
+        Sends the request log to the module's logger instead of stderr
+        """
+        logger.debug(format % args)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', help='report date for the player stats - string in format %m%d%Y. Defaults to the latest snapshot', default=None, type=str)
+    parser.add_argument('-p', help='port to serve on', default=8765, type=int)
+    parser.add_argument('--host', help='host to serve on', default='127.0.0.1', type=str)
+    parser.add_argument('--data-dir', help='directory holding the workbooks - defaults to data/', default=None, type=str)
+    parser.add_argument('--poll', help='seconds between checks for changed workbooks', default=2.0, type=float)
+    args = parser.parse_args()
+
+    service = StatsService(date_str=args.d, poll_interval=args.poll, data_dir=args.data_dir)
+    threading.Thread(target=service.watch, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.p), StatsRequestHandler)
+    server.service = service
+    print(f"Serving on http://{args.host}:{args.p} - /match/<match_id>, /players, /player/<name>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
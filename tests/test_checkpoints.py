@@ -0,0 +1,42 @@
+import sys
+import json
+import pathlib
+
+import pandas as pd
+
+PROJECT_DIR = f"{pathlib.Path(__file__).resolve().parent.parent}" # taking advantage of project filesystem
+sys.path.append(f"{PROJECT_DIR}/src")
+sys.path.append(f"{PROJECT_DIR}/benchmarks")
+from generate_data import make_stats, write_workbook
+from generate_report import Report, load_source_data
+from ratings import STATE_FILE as RATING_STATE_FILE
+from rolling_form import STATE_FILE as FORM_STATE_FILE
+
+def test_snapshot_ending_before_its_file_date(tmp_path):
+    """
+    A snapshot whose last game is before its file date must not reuse checkpoints holding later matches
+    """
+    stats = make_stats(400)
+    sessions = [pd.Timestamp(session) for session in sorted(stats['date'].unique())]
+    # the early snapshot is named after the session two after its last game
+    last_game, checkpoint_date, early_date = sessions[-4], sessions[-3], sessions[-2]
+    write_workbook(f"{tmp_path}/pickup_stats_{early_date:%m%d%Y}.xlsx", {"stats": stats[(stats['date'] <= last_game)]})
+    write_workbook(f"{tmp_path}/pickup_stats_{sessions[-1]:%m%d%Y}.xlsx", {"stats": stats})
+
+    # a batch report between the two checkpoints the matches up to its own date
+    report = Report(f"{checkpoint_date:%m%d%Y}", source_data=load_source_data(data_dir=f"{tmp_path}"), data_dir=f"{tmp_path}", output_dir=f"{tmp_path}")
+    report.get_rating_engine()
+    report.get_current_form()
+
+    report = Report(f"{early_date:%m%d%Y}", data_dir=f"{tmp_path}", output_dir=f"{tmp_path}")
+    assert report.as_of == last_game.date()
+    match_ids = set(report.all_data['match_id'].astype(str).unique())
+    assert report.get_rating_engine().match_ids == match_ids
+    games = report.all_data['name'].astype(str).value_counts()
+    assert (report.get_current_form()['games'] == games.reindex(report.get_current_form().index)).all()
+    assert report.get_rating_engine().get_ratings()['games'].sum() == 4 * len(match_ids)
+
+    # the older report leaves the later checkpoints in place
+    for state_file in (RATING_STATE_FILE, FORM_STATE_FILE):
+        with open(f"{tmp_path}/{state_file}") as f:
+            assert json.load(f)["last_date"] == checkpoint_date.date().isoformat()